@@ -15,6 +15,17 @@ def grade_sub_parser(subparser):
         help='resets all grades for the given exam, if they already exists.',
         action='store_const', const=True,
     )
+    parser.add_argument(
+        '--import', '-i',
+        help='import grades from a CSV or NDJSON file with id, grade and '
+             '(optional) name columns. Use "-" to read from stdin.',
+        dest='import_path',
+    )
+    parser.add_argument(
+        '--overwrite',
+        help='when importing, overwrite conflicting grades.',
+        action='store_const', const=True,
+    )
     return parser
 
 
@@ -26,7 +37,10 @@ def uri_academic_sub_parser(subparser):
     )
     parser.add_argument(
         '--discipline', '-d',
-        help='discipline code in URI academic.',
+        help='discipline codes in URI academic. Many disciplines can be '
+             'given or listed in the [disciplines] section of uriconfig.ini '
+             'as name = code pairs.',
+        nargs='+',
     )
     parser.add_argument(
         '--silent', '-s',
@@ -38,12 +52,24 @@ def uri_academic_sub_parser(subparser):
         help='if given, delayed submissions will be accepted, but will receive'
              'the given penalty. It must be in the 0-100 range.'
     )
+    parser.add_argument(
+        '--format', '-f',
+        help='output format: csv (default), parquet or feather. Columnar '
+             'formats preserve dtypes and require pyarrow.',
+        choices=['csv', 'parquet', 'feather'], default='csv',
+    )
     return parser
 
 
 def compile_sub_parser(subparser):
     parser = subparser('compile',
                        help='compile all data into the main.csv file.')
+    parser.add_argument(
+        '--format', '-f',
+        help='output format: csv (default), parquet or feather. Columnar '
+             'formats preserve dtypes and require pyarrow.',
+        choices=['csv', 'parquet', 'feather'], default='csv',
+    )
 
     # parser.add_argument(
     #    '--pdf',
@@ -56,6 +82,163 @@ def compile_sub_parser(subparser):
     return parser
 
 
+def prefetch_sub_parser(subparser):
+    parser = subparser('prefetch',
+                       help='download all discipline pages into the cache.')
+    parser.add_argument(
+        '--auth', '-a',
+        help='authentication string in the form of username:password.',
+    )
+    parser.add_argument(
+        '--discipline', '-d',
+        help='discipline code in URI academic.',
+    )
+    parser.add_argument(
+        '--workers', '-w',
+        help='number of concurrent downloads (default: 8).',
+        type=int, default=8,
+    )
+    parser.add_argument(
+        '--budget', '-b',
+        help='maximum number of pages downloaded in this run.',
+        type=int,
+    )
+    parser.add_argument(
+        '--expires', '-e',
+        help='skip pages fetched less than the given number of minutes ago '
+             '(default: 60).',
+        type=float, default=60,
+    )
+    parser.add_argument(
+        '--silent', '-s',
+        help='run silently',
+        action='store_const', const=True,
+    )
+    return parser
+
+
+def serve_sub_parser(subparser):
+    parser = subparser('serve',
+                       help='run a daemon that keeps caches warm.')
+    parser.add_argument(
+        '--host',
+        help='address to listen on (defaults to 127.0.0.1).',
+        default='127.0.0.1',
+    )
+    parser.add_argument(
+        '--port', '-p',
+        help='port to listen on. It can also be set in the [serve] section '
+             'of uriconfig.ini.',
+        type=int,
+    )
+    parser.add_argument(
+        '--verbose',
+        help='log all requests',
+        action='store_const', const=True,
+    )
+    return parser
+
+
+def add_export_arguments(parser):
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument(
+        '--ndjson',
+        help='write newline delimited JSON records (default).',
+        action='store_const', dest='format', const='ndjson',
+    )
+    group.add_argument(
+        '--arrow',
+        help='write an Arrow IPC stream of record batches (requires '
+             'pyarrow).',
+        action='store_const', dest='format', const='arrow',
+    )
+    parser.set_defaults(format='ndjson')
+    parser.add_argument(
+        '--output', '-o',
+        help='output file (defaults to stdout).',
+        default='-',
+    )
+
+
+def profiles_sub_parser(subparser):
+    parser = subparser('profiles',
+                       help='stream public submissions of URI profiles.')
+    parser.add_argument(
+        'ids',
+        help='URI ids (defaults to all ids in students.csv).',
+        nargs='*', type=int,
+    )
+    parser.add_argument(
+        '--summary',
+        help='write profile summaries instead of submissions.',
+        action='store_const', const=True,
+    )
+    add_export_arguments(parser)
+    return parser
+
+
+def progress_sub_parser(subparser):
+    parser = subparser('progress',
+                       help='stream the progress matrix of a discipline.')
+    parser.add_argument(
+        '--auth', '-a',
+        help='authentication string in the form of username:password.',
+    )
+    parser.add_argument(
+        '--discipline', '-d',
+        help='discipline code in URI academic.',
+    )
+    parser.add_argument(
+        '--watch', '-w',
+        help='keep polling open homeworks and write changes as they happen.',
+        action='store_const', const=True,
+    )
+    add_export_arguments(parser)
+    return parser
+
+
+def cache_sub_parser(subparser):
+    parser = subparser('cache', help='url cache maintenance.')
+    parser.add_argument(
+        'action',
+        help='gc: remove unreferenced bodies and fix reference counts. '
+             'export/import: save or merge cache entries in a compressed '
+             'bundle file.',
+        choices=['gc', 'export', 'import'],
+    )
+    parser.add_argument(
+        'path',
+        help='bundle file for export/import ("-" for stdout/stdin).',
+        nargs='?', default='urlcache.bundle.gz',
+    )
+    parser.add_argument(
+        '--pattern',
+        help='only export urls matching the given glob pattern.',
+    )
+    parser.add_argument(
+        '--since',
+        help='only export entries fetched after the given date '
+             '(YYYY-MM-DD).',
+    )
+    return parser
+
+
+def db_sub_parser(subparser):
+    parser = subparser('db', help='SQLite datastore maintenance.')
+    parser.add_argument(
+        'action',
+        help='import: load students.csv and exam-*.csv files in the '
+             'datastore. export: write these files from the datastore.',
+        choices=['import', 'export'],
+    )
+    parser.add_argument(
+        'path',
+        help='folder with CSV files (defaults to current folder).',
+        nargs='?', default='.',
+    )
+    return parser
+
+
 def full_parser():
     """Return the argparser for the main program."""
 
@@ -72,10 +255,31 @@ def full_parser():
         help='show program\'s version',
         action='version', version='uritool %s' % __version__
     )
+    parser.add_argument(
+        '--profile',
+        help='run command under cProfile (cpu) or tracemalloc (mem) and save '
+             'a profile dump in the current directory.',
+        choices=['cpu', 'mem'],
+    )
+    parser.add_argument(
+        '--profile-output',
+        help='file name for the profile dump.',
+    )
+    parser.add_argument(
+        '--profile-top',
+        help='number of entries in the profile summary (default: 20).',
+        type=int, default=20,
+    )
     subparsers = parser.add_subparsers(dest='command')
     grade_sub_parser(subparsers.add_parser)
     uri_academic_sub_parser(subparsers.add_parser)
     compile_sub_parser(subparsers.add_parser)
+    serve_sub_parser(subparsers.add_parser)
+    prefetch_sub_parser(subparsers.add_parser)
+    cache_sub_parser(subparsers.add_parser)
+    profiles_sub_parser(subparsers.add_parser)
+    progress_sub_parser(subparsers.add_parser)
+    db_sub_parser(subparsers.add_parser)
     return parser
 
 
@@ -96,6 +300,12 @@ def main(args=None):
         'grade'       : run_grade_command,
         'compile'     : run_compile_command,
         'uri-academic': run_uri_academic_command,
+        'serve'       : run_serve_command,
+        'prefetch'    : run_prefetch_command,
+        'cache'       : run_cache_command,
+        'profiles'    : run_profiles_command,
+        'progress'    : run_progress_command,
+        'db'          : run_db_command,
     }
     try:
         action = actions[args.command]
@@ -103,6 +313,16 @@ def main(args=None):
         del kwds['command'], kwds['clear']
     except KeyError:
         parser.print_usage()
+        return
+
+    profile = kwds.pop('profile')
+    profile_output = kwds.pop('profile_output')
+    profile_top = kwds.pop('profile_top')
+    if profile:
+        from .profiling import profile as profiler
+
+        with profiler(profile, path=profile_output, top=profile_top):
+            action(**kwds)
     else:
         action(**kwds)
 
@@ -110,119 +330,316 @@ def main(args=None):
 #
 # Action runners
 #
-def run_grade_command(exam, reset=False):
-    from .grader import Grader
+def run_grade_command(exam, reset=False, import_path=None, overwrite=False):
+    from .grader import Grader, read_grade_records
 
     main_csv = get_main_csv()
     students = dict(zip(main_csv.index, main_csv['name']))
-    grader = Grader(students, path='exam-%s.csv' % exam)
+    id_type = int if main_csv.index.dtype.kind in 'iu' else str
+    grader = Grader(students, validate_id=id_type, path='exam-%s.csv' % exam,
+                    datastore=get_datastore(), exam=exam)
     if reset:
-        grader.data['grade'] = float('nan')
-    grader.run()
+        grader.reset()
+    if import_path:
+        result = grader.import_records(read_grade_records(import_path),
+                                       overwrite=bool(overwrite))
+        if len(result.invalid):
+            print('\nError: invalid ids or grades. Nothing was imported!')
+            print(result.invalid)
+            raise SystemExit(1)
+        print('%s grades imported (%s new students)' %
+              (result.imported, result.added))
+        if len(result.conflicts):
+            action = 'overwritten' if overwrite else 'skipped'
+            print('\nThese conflicting grades were %s:' % action)
+            print(result.conflicts.to_string(index=False))
+    else:
+        grader.run()
 
 
-def run_compile_command(pdf=False):
+def run_compile_command(pdf=False, format='csv'):
     main_csv = make_main_csv()
-    save_main_csv(main_csv)
+    save_main_csv(main_csv, format)
     if pdf:
         save_main_pdf(main_csv)
 
 
-def run_uri_academic_command(discipline, auth=None, silent=False,
-                             delay_penalty=None):
+def run_uri_academic_command(discipline=None, auth=None, silent=False,
+                             delay_penalty=None, format='csv'):
     import pandas as pd
     from . import urilib
+    from .prefetch import prefetch
+    from .server import Client
+    from .tables import save_table
 
-    # Get valid authentication
-    auth = auth or ':'
-    username, password = auth.split(':')
-    username = username or config.uri_username
-    password = password or config.uri_password
-    discipline = int(discipline or config.uri_discipline)
-    if not (username and password and discipline):
-        msg = ('\n'
-               '    Must provide username:password and discipline.\n'
-               '    Edit uriconfig.ini to set default values.')
-        raise SystemExit(msg)
+    disciplines = get_disciplines(discipline)
+    names = list(disciplines)
+    username, password, _ = get_auth(auth, disciplines[names[0]])
+    students = students_csv()
+
+    # Fetch from academic, reusing a running daemon if possible. Otherwise
+    # all disciplines share a single login and missing pages are downloaded
+    # concurrently.
+    client = Client()
+    if client.available():
+        def grades(name):
+            return client.grades(discipline=disciplines[name],
+                                 username=username,
+                                 password=password,
+                                 delay_penalty=delay_penalty)
+    else:
+        objects = dict(zip(names, urilib.get_disciplines(
+            disciplines.values(), username, password, verbose=not silent)))
+        if len(objects) > 1:
+            batch = list(objects.values())
+            profiles = delay_penalty is not None
+            prefetch(batch, expires=None, profiles=profiles,
+                     verbose=not silent)
+            prefetch(batch, expires=120, profiles=False, closed=False,
+                     verbose=not silent)
+
+        def grades(name):
+            return urilib.get_progress(discipline=objects[name],
+                                       delay_penalty=delay_penalty)
+
+    datastore = get_datastore()
+    tables = {}
+    for name in names:
+        progress = grades(name)
+        if datastore is not None:
+            datastore.set_progress(disciplines[name], progress)
+        table = uri_academic_table(progress, students)
+        tables[name] = table
+        if len(names) > 1:
+            save_table(table, 'uri-%s' % name, format)
+            show_table(table, 'DISCIPLINE %s' % name, silent)
 
-    # Fetch from academic and print
-    table = urilib.get_progress(discipline=discipline,
-                                username=username,
-                                password=password,
-                                delay_penalty=delay_penalty)
-    table = table.drop(config.uri_ignore_ids)
+    # FIXME: save with backup
+    if len(names) == 1:
+        table = tables[names[0]]
+    else:
+        table = pd.concat(tables, names=['discipline'])
+        table = table.reset_index(level='discipline')
+    save_table(table, 'uri', format)
+    show_table(table, 'TABLE', silent)
 
-    # Synchronize with students.csv
-    students = students_csv()
-    is_bad = table.index.isin(students['uri id']) != True
 
-    # Check if there is any unknown student
-    if any(is_bad) and False:
-        bad = table[is_bad]
+def uri_academic_table(table, students):
+    """Synchronize a table of grades indexed by URI id with the students
+    data frame and return a new table indexed by student id.
+
+    The result has name and "uri id" columns followed by the columns of the
+    original table. Students without URI data have empty grades. URI ids
+    that are not in students.csv are reported and dropped."""
+
+    import pandas as pd
+
+    table = table.drop(config.uri_ignore_ids, errors='ignore')
+    table = table.drop(columns=['name'], errors='ignore')
+    table.index = table.index.astype('Int64')
+    uri_ids = pd.to_numeric(students['uri id'], errors='coerce')
+    uri_ids = uri_ids.astype('Int64')
+
+    # Report and drop unknown students
+    is_bad = ~table.index.isin(uri_ids.dropna())
+    if is_bad.any():
         print(
-            '\nError: these URI ids were not found in students.csv!\n'
+            '\nWarning: these URI ids were not found in students.csv and '
+            'were ignored!\n'
             'Either remove them from your discipline or setup the ignore_ids\n'
             'variable in the [uri] section of uriconfig.ini.'
         )
-        print(bad)
-        raise SystemExit(0)
-
-    # Align data by student id
-    align = pd.DataFrame(students.index, index=students['uri id'])
-    table, align = table.align(align, axis=0)
-    table['uri id'] = list(table.index)
-    table['id'] = align.iloc[:, 0]
-    data = table.as_matrix()
-
-    # Recreate data frame from aligned tabular data.
-    # Remove the last column to be the index
-    index = data[:, -1]
-    data = data[:, :-1]
-    columns = list(table.columns)[:-1]
-    table = pd.DataFrame(data, index=index, columns=columns)
-
-    # Use names from students.csv
-    table['name'] = students['name']
-
-    # Reorganize rows and columns in a better order
-    table.sort_index(inplace=True)
-    columns = list(table.columns)
-    columns.insert(1, columns.pop())
-    table = table[columns]
+        print(table[is_bad])
+        table = table[~is_bad]
 
-    # FIXME: save with backup
-    table.to_csv('uri.csv')
+    # Merge by URI id and use names from students.csv
+    result = pd.DataFrame({'name': students['name'], 'uri id': uri_ids},
+                          index=students.index)
+    result = result.join(table, on='uri id')
+    result.index.name = 'id'
+    return result.sort_index()
+
+
+def show_table(table, title, silent=False):
+    """Print head and tail of table."""
 
-    # Print table
     if not silent:
-        print('TABLE HEAD\n==========')
+        print('%s HEAD\n%s' % (title, '=' * (len(title) + 5)))
         print(table.head())
         print('...\n')
-        print('TABLE TAIL\n==========')
-        print(table.head())
+        print('%s TAIL\n%s' % (title, '=' * (len(title) + 5)))
+        print(table.tail())
+
+
+def run_prefetch_command(discipline=None, auth=None, workers=8, budget=None,
+                         expires=60, silent=False):
+    from .urilib import Discipline
+    from .prefetch import prefetch
+
+    username, password, discipline = get_auth(auth, discipline)
+    discipline = Discipline(discipline, username=username, password=password)
+    fetched, failed = prefetch(discipline, workers=workers, budget=budget,
+                               expires=expires, verbose=not silent)
+    if not silent:
+        print('%s pages fetched, %s errors' % (fetched, failed))
+    if failed:
+        raise SystemExit(1)
+
+
+def run_serve_command(host='127.0.0.1', port=None, verbose=False):
+    from .server import serve
+
+    serve(host, port, verbose=bool(verbose))
+
+
+def run_cache_command(action, path='urlcache.bundle.gz', pattern=None,
+                      since=None):
+    import datetime
+    from .httpcache import urlgc, urlexport, urlimport
+
+    if action == 'gc':
+        stats = urlgc()
+        print('%(urls)s urls, %(bodies)s bodies (%(removed)s removed, '
+              '%(migrated)s migrated)' % stats)
+    elif action == 'export':
+        if since:
+            try:
+                since = datetime.datetime.strptime(since, '%Y-%m-%d')
+            except ValueError:
+                raise SystemExit('invalid date: %s' % since)
+        count = urlexport(path, pattern=pattern, since=since)
+        if path != '-':
+            print('%s entries exported to %s' % (count, path))
+    elif action == 'import':
+        try:
+            imported, skipped = urlimport(path)
+        except (OSError, ValueError) as ex:
+            raise SystemExit('could not import %s: %s' % (path, ex))
+        print('%s entries imported (%s older entries skipped)' %
+              (imported, skipped))
+
+
+def run_profiles_command(ids=(), summary=False, format='ndjson',
+                         output='-'):
+    from .export import open_writer, export_problems, export_profiles
+
+    ids = ids or list(students_csv()['uri id'].dropna().astype(int))
+    export = export_profiles if summary else export_problems
+    kind = 'profiles' if summary else 'problems'
+    writer = open_writer(output, format, kind)
+    try:
+        export(writer, ids)
+    finally:
+        writer.close()
+
+
+def run_progress_command(discipline=None, auth=None, watch=False,
+                         format='ndjson', output='-'):
+    from .export import open_writer, export_progress
+    from .urilib import Discipline
+
+    username, password, discipline = get_auth(auth, discipline)
+    discipline = Discipline(discipline, username=username, password=password)
+    writer = open_writer(output, format, 'progress')
+    try:
+        export_progress(writer, discipline, watch=bool(watch))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        writer.close()
+
+
+def run_db_command(action, path='.'):
+    datastore = get_datastore()
+    if datastore is None:
+        raise SystemExit('datastore is not enabled. Set the datastore option '
+                         'in the [conf] section of uriconfig.ini.')
+    with datastore:
+        if action == 'import':
+            count = datastore.import_csv(path)
+            print('%s exams imported in %s' % (count, datastore.path))
+        elif action == 'export':
+            datastore.export_csv(path)
+            print('CSV files saved in %s' % path)
 
 
 #
 # Utilities
 #
+def get_auth(auth=None, discipline=None):
+    """Return a valid (username, password, discipline) tuple from the given
+    authentication string and discipline, with defaults taken from
+    uriconfig.ini."""
+
+    auth = auth or ':'
+    username, password = auth.split(':')
+    username = username or config.uri_username
+    password = password or config.uri_password
+    discipline = discipline or config.uri_discipline
+    if not (username and password and discipline):
+        msg = ('\n'
+               '    Must provide username:password and discipline.\n'
+               '    Edit uriconfig.ini to set default values.')
+        raise SystemExit(msg)
+    return username, password, int(discipline)
+
+
+def get_disciplines(disciplines=None):
+    """Return a dictionary mapping names to discipline codes.
+
+    Disciplines can be given as a list of codes (possibly comma separated).
+    Otherwise, it uses the [disciplines] section of uriconfig.ini or the
+    default discipline of the [uri] section."""
+
+    if disciplines:
+        codes = [x.strip() for arg in disciplines for x in arg.split(',')]
+        codes = [x for x in codes if x]
+        try:
+            return {code: int(code) for code in codes}
+        except ValueError:
+            raise SystemExit('invalid discipline code: %s' % ', '.join(codes))
+    if config.uri_disciplines:
+        return dict(config.uri_disciplines)
+    return {str(config.uri_discipline): config.uri_discipline}
+
+
+def get_datastore():
+    """Return the Datastore set in the [conf] section of uriconfig.ini or
+    None if it is not enabled."""
+
+    if not config.datastore:
+        return None
+    from .datastore import Datastore
+
+    return Datastore(config.datastore)
+
+
 def get_main_csv():
-    """Return a DataFrame holding data of the main.csv file"""
+    """Return a DataFrame holding data of the main.csv file.
+
+    Columnar versions of this file (main.parquet or main.feather) are used
+    if present."""
 
     import pandas as pd
+    from .tables import read_table
 
     try:
-        df = pd.read_csv('main.csv')
+        df = read_table('main')
     except FileNotFoundError:
         index = pd.Series([], name='id')
         return pd.DataFrame([], index=index)
-    df.index = df['id']
+    if df.index.name != 'id':
+        df.index = df['id']
     return df
 
 
-def save_main_csv(df):
-    """Saves main data frame in the main.csv file."""
+def save_main_csv(df, format='csv'):
+    """Saves main data frame in the main.csv file (or main.parquet and
+    main.feather for the respective formats)."""
+
+    from .tables import save_table
 
-    df.to_csv('main.csv')
+    save_table(df, 'main', format)
 
 
 def save_main_pdf(df):
@@ -231,23 +648,18 @@ def save_main_pdf(df):
     raise NotImplementedError
 
 
-def make_main_csv():
-    """Return a data frame with the collected content for the main.csv file."""
+def make_main_csv(path=None):
+    """Return a data frame with the collected content for the main.csv file.
 
-    import pandas as pd
+    Exam files are read from path (defaults to the current directory).
+    Grades are read from the datastore, if it is enabled."""
 
-    # Start with an empty data frame
-    index = pd.Series([], name='id')
-    main_df = pd.DataFrame([], index=index)
+    from .compiler import collect_exams
 
-    # Collect all exams
-    files = [f for f in os.listdir(os.getcwd())
-             if f.startswith('exam-') and f.endswith('.csv')]
-    for f in files:
-        name = f[5:-4]
-        df = pd.read_csv(f)
-        df.index = df['id']
-        main_df[name] = df['grade']
+    datastore = get_datastore()
+    if datastore is not None:
+        return datastore.main_table()
+    main_df = collect_exams(path or os.getcwd())
 
     # Collect all data from URI academic
     # ...
@@ -255,12 +667,16 @@ def make_main_csv():
 
 
 def students_csv():
-    """Return a data frame with data in students.csv."""
+    """Return a data frame with data in students.csv.
+
+    Columnar versions of this file (students.parquet or students.feather) are
+    used if present."""
 
     import pandas as pd
+    from .tables import read_table
 
     try:
-        df = pd.read_csv('students.csv')
+        df = read_table('students')
     except OSError:
         index = pd.Series([], name='id')
         df = pd.DataFrame({
@@ -269,7 +685,8 @@ def students_csv():
                               }, index=index)
         df.to_csv('students.csv')
         return df
-    df.index = df['id']
+    if df.index.name != 'id':
+        df.index = df['id']
     if 'name' not in df:
         df['name'] = [str(x) for x in df.index]
     if 'uri id' not in df:
@@ -0,0 +1,103 @@
+"""
+Incremental collection of exam-*.csv files for the compile command.
+"""
+import os
+import json
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+
+__all__ = ['collect_exams']
+
+MANIFEST_NAME = '.uritool-compile.json'
+CACHE_NAME = '.uritool-compile-cache.json'
+
+
+def collect_exams(path='.', workers=None):
+    """Return a data frame with the grades in all exam-*.csv files in path.
+
+    Each column corresponds to an exam and the index holds student ids. A
+    manifest with the mtime, size and hash of each exam file is stored in
+    path together with the grades extracted from each file. Both are plain
+    JSON files, hence loading them never runs code from the course folder.
+    Only files whose contents changed since the last call are read again.
+    Those files are read in parallel using a thread pool with the given
+    number of workers.
+    """
+
+    manifest_path = os.path.join(path, MANIFEST_NAME)
+    cache_path = os.path.join(path, CACHE_NAME)
+    manifest, cache = _load_cache(manifest_path, cache_path)
+
+    files = sorted(f for f in os.listdir(path)
+                   if f.startswith('exam-') and f.endswith('.csv'))
+
+    # Find changed files
+    new_manifest, changed = {}, []
+    for f in files:
+        stat = os.stat(os.path.join(path, f))
+        entry = manifest.get(f)
+        info = {'mtime': stat.st_mtime_ns, 'size': stat.st_size}
+        if (entry and f in cache and entry['mtime'] == info['mtime'] and
+                entry['size'] == info['size']):
+            new_manifest[f] = entry
+            continue
+        info['hash'] = _file_hash(os.path.join(path, f))
+        new_manifest[f] = info
+        if not (entry and f in cache and entry['hash'] == info['hash']):
+            changed.append(f)
+
+    # Read changed files in parallel
+    if changed:
+        paths = [os.path.join(path, f) for f in changed]
+        with ThreadPoolExecutor(workers) as executor:
+            for f, grades in zip(changed, executor.map(_read_grades, paths)):
+                cache[f] = grades
+    cache = {f: cache[f] for f in files}
+    if changed or manifest != new_manifest:
+        _save_cache(manifest_path, cache_path, new_manifest, cache)
+
+    # Assemble result
+    if not files:
+        index = pd.Series([], name='id')
+        return pd.DataFrame([], index=index)
+    columns = {f[5:-4]: cache[f] for f in files}
+    df = pd.concat(columns, axis=1)
+    df.index.name = 'id'
+    return df
+
+
+def _read_grades(path):
+    df = pd.read_csv(path)
+    return pd.Series(df['grade'].values, index=df['id'].values)
+
+
+def _file_hash(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as F:
+        for chunk in iter(lambda: F.read(1 << 16), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _load_cache(manifest_path, cache_path):
+    try:
+        with open(manifest_path) as F:
+            manifest = json.load(F)
+        with open(cache_path) as F:
+            cache = {f: pd.Series(entry['grades'], index=entry['ids'])
+                     for f, entry in json.load(F).items()}
+    except Exception:
+        return {}, {}
+    return manifest, cache
+
+
+def _save_cache(manifest_path, cache_path, manifest, cache):
+    data = {f: {'ids': grades.index.tolist(), 'grades': grades.tolist()}
+            for f, grades in cache.items()}
+    with open(cache_path + '.tmp', 'w') as F:
+        json.dump(data, F)
+    os.replace(cache_path + '.tmp', cache_path)
+    with open(manifest_path + '.tmp', 'w') as F:
+        json.dump(manifest, F)
+    os.replace(manifest_path + '.tmp', manifest_path)
@@ -1,3 +1,14 @@
+"""
+Configuration constants read from the uriconfig.ini file.
+
+The file is searched from the current directory upwards only when some
+constant is accessed for the first time. The result is cached for the rest of
+the program.
+"""
+import functools
+
+
+@functools.lru_cache(maxsize=None)
 def _read_config():
     """Read configuration in .uriconfig.ini."""
 
@@ -18,17 +29,49 @@ def _read_config():
     return parser
 
 
+def _ignore_ids(config):
+    ids = config.get('uri', 'ignore_ids', fallback='')
+    return [int(x) for x in ids.split(',') if x.strip()]
+
+
+def _disciplines(config):
+    if not config.has_section('disciplines'):
+        return {}
+    return {name: int(pk) for name, pk in config.items('disciplines')}
+
+
 #
-# Load config constants
+# Config constants
 #
-_config = _read_config()
+_options = {
+    # URI section
+    'uri_username': lambda c: c.get('uri', 'username', fallback=None),
+    'uri_password': lambda c: c.get('uri', 'password', fallback=None),
+    'uri_discipline': lambda c: c.get('uri', 'discipline', fallback=None),
+    'uri_ignore_ids': _ignore_ids,
+    'uri_disciplines': _disciplines,
+
+    # Daemon
+    'serve_port': lambda c: c.getint('serve', 'port', fallback=8765),
+
+    # Generic sections
+    'urlcache': lambda c: c.get('conf', 'urlcache', fallback='urlcache.db'),
+    'datastore': lambda c: c.get('conf', 'datastore', fallback=None),
+}
+
+
+def __getattr__(name):
+    try:
+        option = _options[name]
+    except KeyError:
+        raise AttributeError(name)
+    value = globals()[name] = option(_read_config())
+    return value
+
 
-# URI section
-uri_username = _config.get('uri', 'username', fallback=None)
-uri_password = _config.get('uri', 'password', fallback=None)
-uri_discipline = _config.get('uri', 'discipline', fallback=None)
-uri_ignore_ids = _config.get('uri', 'ignore_ids', fallback='')
-uri_ignore_ids = list(map(int, uri_ignore_ids.split(',')))
+def reload():
+    """Discard cached values and read uriconfig.ini again on next access."""
 
-# Generic sections
-urlcache = _config.get('conf', 'urlcache', fallback='urlcache.db')
+    _read_config.cache_clear()
+    for name in _options:
+        globals().pop(name, None)
@@ -0,0 +1,252 @@
+"""
+Optional SQLite storage for the course state.
+
+The datastore keeps students, exams, grades and URI progress in a single
+database file. It is enabled by the "datastore" option in the [conf] section
+of uriconfig.ini. CSV files can be imported to and exported from the
+database.
+"""
+import os
+import sqlite3
+import datetime
+from decimal import Decimal
+
+__all__ = ['Datastore']
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS students (
+    id PRIMARY KEY,
+    name TEXT,
+    uri_id INTEGER
+);
+CREATE INDEX IF NOT EXISTS students_uri_id ON students (uri_id);
+
+CREATE TABLE IF NOT EXISTS exams (
+    name TEXT PRIMARY KEY
+);
+
+CREATE TABLE IF NOT EXISTS grades (
+    exam TEXT NOT NULL REFERENCES exams (name),
+    student NOT NULL,
+    grade REAL,
+    timestamp TEXT,
+    PRIMARY KEY (exam, student)
+);
+CREATE INDEX IF NOT EXISTS grades_student ON grades (student);
+
+CREATE TABLE IF NOT EXISTS uri_progress (
+    discipline INTEGER NOT NULL,
+    homework INTEGER NOT NULL,
+    uri_id INTEGER NOT NULL,
+    grade REAL,
+    PRIMARY KEY (discipline, homework, uri_id)
+);
+CREATE INDEX IF NOT EXISTS uri_progress_uri_id ON uri_progress (uri_id);
+'''
+
+
+class Datastore:
+    """SQLite database with the course state.
+
+    Parameters
+    ----------
+
+    path : str
+        Path to the database file. It is created if it does not exist.
+    """
+
+    def __init__(self, path='uritool.db'):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    #
+    # Students
+    #
+    def set_students(self, students):
+        """Insert or update students from a data frame indexed by id with
+        name and "uri id" columns."""
+
+        rows = [(_pyvalue(id_), _pyvalue(name), _pyvalue(uri_id))
+                for id_, name, uri_id in zip(students.index,
+                                             students['name'],
+                                             students['uri id'])]
+        with self.connection:
+            self.connection.executemany(
+                'INSERT INTO students (id, name, uri_id) VALUES (?, ?, ?) '
+                'ON CONFLICT (id) DO UPDATE SET name = excluded.name, '
+                'uri_id = excluded.uri_id', rows)
+
+    def students(self):
+        """Return a data frame with the students table indexed by id."""
+
+        import pandas as pd
+
+        df = pd.read_sql_query('SELECT id, name, uri_id AS "uri id" '
+                               'FROM students ORDER BY id', self.connection)
+        df.index = df['id']
+        return df
+
+    #
+    # Grades
+    #
+    def set_grade(self, exam, student, grade, timestamp=None):
+        """Insert or update the grade of a single student."""
+
+        self.set_grades(exam, [(student, grade, timestamp)])
+
+    def set_grades(self, exam, grades):
+        """Insert or update grades from a sequence of (student, grade,
+        timestamp) tuples."""
+
+        rows = [(exam, _pyvalue(student), _pyvalue(grade), _isotime(time))
+                for student, grade, time in grades]
+        with self.connection:
+            self.connection.execute(
+                'INSERT OR IGNORE INTO exams (name) VALUES (?)', (exam,))
+            self.connection.executemany(
+                'INSERT INTO grades (exam, student, grade, timestamp) '
+                'VALUES (?, ?, ?, ?) ON CONFLICT (exam, student) DO UPDATE '
+                'SET grade = excluded.grade, timestamp = excluded.timestamp',
+                rows)
+
+    def grades(self, exam):
+        """Return a dictionary mapping student ids to their grades in the
+        given exam."""
+
+        cursor = self.connection.execute(
+            'SELECT student, grade FROM grades WHERE exam = ?', (exam,))
+        return dict(cursor)
+
+    def exams(self):
+        """Return the list of exam names."""
+
+        cursor = self.connection.execute(
+            'SELECT name FROM exams ORDER BY name')
+        return [name for name, in cursor]
+
+    def main_table(self):
+        """Return a data frame with one column per exam and student ids as
+        index, as in the main.csv file."""
+
+        import pandas as pd
+
+        df = pd.read_sql_query('SELECT student, exam, grade FROM grades '
+                               'ORDER BY student', self.connection)
+        if df.empty:
+            index = pd.Series([], name='id')
+            return pd.DataFrame([], index=index)
+        df = df.pivot(index='student', columns='exam', values='grade')
+        df = df[[exam for exam in self.exams() if exam in df.columns]]
+        df.index.name = 'id'
+        df.columns.name = None
+        return df
+
+    #
+    # URI progress
+    #
+    def set_progress(self, discipline, table):
+        """Replace the URI progress of a discipline with the given table
+        indexed by URI id with one column per homework. Non numeric columns
+        (e.g., student names) are ignored."""
+
+        table = table.select_dtypes('number')
+        rows = [(int(discipline), int(hw), int(uri_id), _pyvalue(grade))
+                for hw in table.columns
+                for uri_id, grade in table[hw].items()]
+        with self.connection:
+            self.connection.execute(
+                'DELETE FROM uri_progress WHERE discipline = ?',
+                (int(discipline),))
+            self.connection.executemany(
+                'INSERT INTO uri_progress VALUES (?, ?, ?, ?)', rows)
+
+    def progress(self, discipline=None):
+        """Return a table indexed by URI id with one column per homework."""
+
+        import pandas as pd
+
+        query = 'SELECT uri_id, homework, grade FROM uri_progress'
+        params = ()
+        if discipline is not None:
+            query += ' WHERE discipline = ?'
+            params = (int(discipline),)
+        df = pd.read_sql_query(query, self.connection, params=params)
+        df = df.pivot(index='uri_id', columns='homework', values='grade')
+        df.columns.name = None
+        return df
+
+    #
+    # CSV import/export
+    #
+    def import_csv(self, path='.'):
+        """Import students.csv and all exam-*.csv files in path.
+
+        Return the number of imported exams."""
+
+        import pandas as pd
+
+        students = os.path.join(path, 'students.csv')
+        if os.path.exists(students):
+            df = pd.read_csv(students)
+            df.index = df['id']
+            if 'name' not in df:
+                df['name'] = [str(x) for x in df.index]
+            if 'uri id' not in df:
+                df['uri id'] = None
+            self.set_students(df)
+
+        files = sorted(f for f in os.listdir(path)
+                       if f.startswith('exam-') and f.endswith('.csv'))
+        for f in files:
+            df = pd.read_csv(os.path.join(path, f))
+            times = df['timestamp'] if 'timestamp' in df else [None] * len(df)
+            self.set_grades(f[5:-4], zip(df['id'], df['grade'], times))
+        return len(files)
+
+    def export_csv(self, path='.'):
+        """Write students.csv, main.csv and one exam-<name>.csv file per exam
+        in path."""
+
+        import pandas as pd
+
+        students = self.students()
+        students.drop(columns='id').to_csv(os.path.join(path, 'students.csv'))
+        names = students['name']
+        self.main_table().to_csv(os.path.join(path, 'main.csv'))
+        for exam in self.exams():
+            df = pd.read_sql_query(
+                'SELECT student AS id, grade, timestamp FROM grades '
+                'WHERE exam = ? ORDER BY student', self.connection,
+                params=(exam,))
+            df.index = df.pop('id')
+            df.insert(0, 'name', [names.get(id_, id_) for id_ in df.index])
+            df.to_csv(os.path.join(path, 'exam-%s.csv' % exam))
+
+
+def _pyvalue(value):
+    # Grades are REAL columns, hence Decimal grades are stored as floats
+    if hasattr(value, 'item'):
+        value = value.item()
+    if isinstance(value, Decimal):
+        value = float(value)
+    if isinstance(value, float) and value != value:
+        return None
+    return value
+
+
+def _isotime(value):
+    if value is None or value != value:
+        return None
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    return str(value)
@@ -0,0 +1,203 @@
+"""
+Streaming exporters for scraped data.
+
+Records are written as soon as they are produced, either as newline
+delimited JSON or as Arrow IPC record batches. Each stream holds a single
+kind of record:
+
+* problems: public submissions of a profile (see :func:`export_problems`)
+* profiles: profile summaries (see :func:`export_profiles`)
+* progress: changes in the progress matrix (see :func:`export_progress`)
+"""
+import datetime
+import json
+import math
+import sys
+
+__all__ = ['NDJSONWriter', 'ArrowWriter', 'open_writer', 'export_problems',
+           'export_profiles', 'export_progress', 'EXPORT_FORMATS']
+
+EXPORT_FORMATS = ['ndjson', 'arrow']
+
+# Arrow types of the fields in each kind of record
+SCHEMAS = {
+    'problems': [
+        ('profile', 'int64'), ('id', 'int64'), ('name', 'string'),
+        ('ranking', 'int64'), ('submission', 'string'), ('lang', 'string'),
+        ('time', 'double'), ('date', 'timestamp[us]'),
+    ],
+    'profiles': [
+        ('id', 'int64'), ('username', 'string'), ('university', 'string'),
+        ('country', 'string'), ('solved', 'int64'), ('tried', 'int64'),
+        ('submissions', 'int64'), ('ranking', 'int64'), ('date', 'date32'),
+    ],
+    'progress': [
+        ('homework', 'int64'), ('student', 'int64'), ('problem', 'int64'),
+        ('old', 'double'), ('new', 'double'), ('time', 'timestamp[us]'),
+    ],
+}
+
+
+class NDJSONWriter:
+    """Write records as JSON objects, one per line.
+
+    Dates are written in ISO format and NaNs as null."""
+
+    def __init__(self, file):
+        self.file = file
+
+    def write(self, records):
+        """Write a list of dictionaries and flush the stream."""
+
+        for record in records:
+            record = {k: _jsonable(v) for k, v in record.items()}
+            self.file.write(json.dumps(record, default=str))
+            self.file.write('\n')
+        self.file.flush()
+
+    def close(self):
+        if self.file is not sys.stdout:
+            self.file.close()
+
+
+class ArrowWriter:
+    """Write records as an Arrow IPC stream.
+
+    Each call to write() emits one record batch. The schema is given by the
+    kind of record (see SCHEMAS) or inferred from the first batch."""
+
+    def __init__(self, file, kind=None):
+        import pyarrow as pa
+
+        self.file = file
+        self.writer = None
+        self.schema = None
+        if kind is not None:
+            self.schema = pa.schema([(name, pa.type_for_alias(type_))
+                                     for name, type_ in SCHEMAS[kind]])
+
+    def write(self, records):
+        import pyarrow as pa
+
+        if not records:
+            return
+        records = [{k: _arrowable(v) for k, v in record.items()}
+                   for record in records]
+        batch = pa.RecordBatch.from_pylist(records, schema=self.schema)
+        if self.writer is None:
+            self.schema = batch.schema
+            self.writer = pa.ipc.new_stream(self.file, self.schema)
+        self.writer.write_batch(batch)
+        self.file.flush()
+
+    def close(self):
+        import pyarrow as pa
+
+        # Empty streams still carry the schema, if it is known
+        if self.writer is None and self.schema is not None:
+            self.writer = pa.ipc.new_stream(self.file, self.schema)
+        if self.writer is not None:
+            self.writer.close()
+        if self.file is not sys.stdout.buffer:
+            self.file.close()
+
+
+def open_writer(path='-', format='ndjson', kind=None):
+    """Return a writer for the given path ("-" for stdout) and format.
+
+    The kind of record ('problems', 'profiles' or 'progress') fixes the
+    schema of Arrow streams."""
+
+    if format == 'ndjson':
+        file = sys.stdout if path == '-' else open(path, 'w', encoding='utf8')
+        return NDJSONWriter(file)
+    elif format == 'arrow':
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise SystemExit('pyarrow is required for Arrow output. Install '
+                             'it with "pip install pyarrow".')
+        file = sys.stdout.buffer if path == '-' else open(path, 'wb')
+        return ArrowWriter(file, kind)
+    raise ValueError('invalid format: %r' % format)
+
+
+#
+# Exporters
+#
+def export_problems(writer, ids, verbose=False):
+    """Write public submissions of the given profiles. Each profile is
+    written as soon as all of its pages are read."""
+
+    from .urilib import get_public_problems
+
+    for id_ in ids:
+        problems = get_public_problems(id_, verbose=verbose)
+        writer.write([dict(profile=id_, **row._asdict())
+                      for row in problems.itertuples(index=False)])
+
+
+def export_profiles(writer, ids, verbose=False):
+    """Write a summary of each of the given profiles.
+
+    Profiles that could not be read (e.g., missing or malformed pages) are
+    skipped and reported to stderr. Return the list of skipped ids."""
+
+    from .urilib import iter_cohort
+
+    skipped = []
+    for id_, profile, _ in iter_cohort(list(ids), verbose=verbose):
+        if profile is None:
+            skipped.append(id_)
+            continue
+        writer.write([dict(id=id_, **profile._asdict())])
+    if skipped:
+        print('warning: could not read profiles: %s' %
+              ', '.join(map(str, skipped)), file=sys.stderr)
+    return skipped
+
+
+def export_progress(writer, discipline, watch=False, **kwds):
+    """Write the progress of all homeworks of a discipline as Change
+    records.
+
+    The first batch of each homework has all non-empty cells. If watch is
+    True, homeworks are polled according to their deadlines and only the
+    changes are written. Additional keyword arguments are passed to
+    :meth:`uritool.urilib.Discipline.scheduler`."""
+
+    from .grades import diff_progress
+    from .httpcache import urldate
+    from .urilib import PROGRESS_URL
+
+    for hw in discipline.homeworks.index:
+        new = discipline.progress(hw)
+        discipline.snapshots[hw] = new
+        changes = diff_progress(None, new, hw, urldate(PROGRESS_URL % hw))
+        writer.write([change._asdict() for change in changes])
+
+    if watch:
+        def callback(homework, changes):
+            writer.write([change._asdict() for change in changes])
+
+        discipline.scheduler(callback, **kwds).run()
+
+
+def _jsonable(value):
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    if hasattr(value, 'item'):
+        value = value.item()
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    return value
+
+
+def _arrowable(value):
+    if hasattr(value, 'to_pydatetime'):
+        return value.to_pydatetime()
+    if hasattr(value, 'item'):
+        value = value.item()
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    return value
@@ -1,7 +1,21 @@
+import io
 import os
+import re
+import sys
+import gzip
+import json
+import bisect
+import shutil
+import hashlib
+from collections import namedtuple
 from decimal import Decimal, InvalidOperation
 from datetime import datetime
 import pandas as pd
+from .search import SearchIndex
+from .journal import Journal
+
+# Result of Grader.import_records()
+ImportResult = namedtuple('ImportResult', 'imported added conflicts invalid')
 
 # Names
 __all__ = ['Grade', 'Grader']
@@ -19,6 +33,22 @@ class ValidationError(Exception):
     """Exception raised for failed validations."""
 
 
+class Record:
+    """A row of the grading table."""
+
+    __slots__ = ('id', 'name', 'grade', 'timestamp', 'extra')
+
+    def __init__(self, id, name, grade=None, timestamp=None, extra=None):
+        self.id = id
+        self.name = name
+        self.grade = grade
+        self.timestamp = timestamp
+        self.extra = extra or {}
+
+    def __repr__(self):
+        return 'Record(%r, %r, %r)' % (self.id, self.name, self.grade)
+
+
 class Grader:
     """Simple command line tool that helps registering grades of lots of
     students.
@@ -26,6 +56,9 @@ class Grader:
     After the Grader is initialized, its `.run()` method should be called in
     order to start the grading process.
 
+    Grades are kept in a dictionary of :class:`Record` objects together with
+    a sorted list of ids. A data frame is only created by `.report()`.
+
     Parameters
     ----------
 
@@ -42,36 +75,57 @@ class Grader:
     path : str
         Path to a CSV file that holds grading data for the given job. This file
         must have a
+    compact_every : int
+        Grading events are appended to a journal file (``path + '.journal'``)
+        and the CSV file is only rewritten after this many events and when
+        grading finishes.
+    backups : int
+        Number of snapshots of the CSV file that are kept in the backup/
+        folder. Use None to keep all snapshots.
+    compress_backups : bool
+        If True, snapshots are gzip compressed.
+    datastore : Datastore
+        A :class:`uritool.datastore.Datastore` that receives each grade as a
+        row update. All grades are written to it when the grader saves.
+    exam : str
+        Name of the exam in the datastore.
     """
 
     def __init__(self, students={}, validate_grade=None, validate_id=str,
-                 path=None):
-        # Create dataframe from students dict
-        data = [(x, str(y or x)) for (x, y) in students.items()]
-        data.sort(key=lambda x: x[0])
-        index = pd.Series([x[0] for x in data], name='id')
-        names = [str(x[1]) for x in data]
-        self.data = pd.DataFrame({
-                                     'name': names
-                                     }, index=index)
-
-        # Add extra columns
-        search = ['%s %s' % (x.casefold(), y) for (x, y) in zip(names, index)]
-        self.data['__search'] = search
-        self.data['grade'] = float('nan')
-        self.data['timestamp'] = datetime.now()
-
+                 path=None, compact_every=50, backups=5,
+                 compress_backups=False, datastore=None, exam=None):
         # Register validators
-        self.validate_grade = self.__auto_validate_grade()
+        self.validate_grade = self.__auto_validate_grade(validate_grade)
         self.validate_id = self.__auto_validate_id(validate_id)
+        self.id_type = validate_id
+
+        # Create records from students dict
+        now = datetime.now()
+        self.records = {}
+        self.ids = []
+        self.columns = []
+        self.search_index = SearchIndex()
+        self.journal = None
+        for id_, name in students.items():
+            self.__insert_student(self.__convert_id(id_), str(name or id_),
+                                  now)
+
+        if datastore is not None and exam is None:
+            raise ValueError('exam name is required with a datastore')
+        self.datastore = datastore
+        self.exam = exam
 
         # Saves path and a backup
         self.path = path
+        self.compact_every = compact_every
+        self.backups = backups
+        self.compress_backups = compress_backups
         if path is not None:
+            self.journal = Journal(path + '.journal')
             if os.path.exists(path):
                 self.update_from_path(path)
                 self.save_backup(path)
-            self.save_to_path(path)
+            self.save()
 
     def update_from_path(self, path):
         """Update the grading Job contents from the given file.
@@ -88,56 +142,164 @@ class Grader:
         order. If the CSV file has additional columns, they will be preserved
         and new rows will be filled with nan's.
 
+        Events stored in the journal file associated with path are replayed
+        on top of the CSV data.
         """
 
+        self.__merge_csv(path)
+        if self.journal is not None and self.journal.path == path + '.journal':
+            self.sync()
+        else:
+            self.__apply_records(Journal(path + '.journal').replay())
+
+    def sync(self):
+        """Pick up grades registered by other graders that share the same
+        file.
+
+        Return a list of (record, previous grade) pairs for every incoming
+        grade that differs from a previously registered grade. Incoming
+        grades older than the local ones (according to the timestamp column)
+        are ignored."""
+
+        if self.journal is None:
+            return []
+        records, truncated = self.journal.read_new()
+        if truncated:
+            self.__merge_csv(self.path)
+        return self.__apply_records(records)
+
+    def __merge_csv(self, path):
+
         df = pd.read_csv(path)
         df.index = df.pop('id')
 
-        # Set default 'timestamp' and 'auto' columns
-        try:
+        # Set default 'timestamp' column
+        if 'timestamp' in df:
             df['timestamp'] = pd.DatetimeIndex(df['timestamp'])
-        except KeyError:
-            df['timestamp'] = self._zero.timestamp
+        else:
+            df['timestamp'] = None
 
         # Normalize search
         if 'name' not in df:
             df['name'] = [str(x) for x in df.index]
-
-        # Normalize __search column
-        df['__search'] = ['%s (%s)' % (x.casefold(), y)
-                          for (x, y) in zip(df['name'], df.index)]
+        if 'grade' not in df:
+            df['grade'] = None
 
         # Update data
-        self.data = self.data.align(df)[0]
-        self.data.update(df)
+        extra = [col for col in df.columns
+                 if col not in ('name', 'grade', 'timestamp')]
+        self.columns.extend(col for col in extra if col not in self.columns)
+        for id_, row in zip(df.index, df.to_dict('records')):
+            id_ = self.__convert_id(id_)
+            if id_ not in self.records:
+                self.__insert_student(id_, str(row['name']))
+            record = self.records[id_]
+            record.name = str(row['name'])
+            self.search_index.add(id_, '%s %s' % (record.name, id_))
+
+            # The file may be older than grades registered locally after
+            # another grader compacted the journal
+            grade, timestamp = row['grade'], row['timestamp']
+            newer = record.timestamp is None or (
+                not _isnull(timestamp) and timestamp > record.timestamp)
+            if _isnull(record.grade) or (newer and not _isnull(grade)):
+                if not _isnull(grade):
+                    record.grade = grade
+                if not _isnull(timestamp):
+                    record.timestamp = timestamp
+            for col in extra:
+                if not _isnull(row[col]):
+                    record.extra[col] = row[col]
+
+    def __print_conflicts(self, conflicts):
+        for record, previous in conflicts:
+            msg = 'warning: %s was graded by %s as %s (previous grade: %s)'
+            print(msg % (record['id'], record.get('writer', 'another grader'),
+                         record['grade'], previous))
+
+    def __apply_records(self, records):
+        # Apply journal records without recording them again
+        conflicts = []
+        journal, self.journal = self.journal, None
+        try:
+            for record in records:
+                id_ = record['id'] = self.__convert_id(record['id'])
+                if id_ not in self.records:
+                    name = record['name'] or str(id_)
+                    self.__insert_student(id_, name, record['timestamp'])
+                grade = record['grade']
+                if grade is None:
+                    continue
+                current = self.records[id_]
+                if _isnull(current.grade):
+                    self.set_grade(id_, grade, record['timestamp'])
+                elif not _same_grade(current.grade, grade):
+                    conflicts.append((record, current.grade))
+                    if (current.timestamp is None or
+                            record['timestamp'] >= current.timestamp):
+                        self.set_grade(id_, grade, record['timestamp'])
+        finally:
+            self.journal = journal
+        return conflicts
 
     def save_to_path(self, path):
         """Save a report in the given file."""
 
-        self.report().to_csv(path)
+        tmp_path = path + '.tmp'
+        self.report().to_csv(tmp_path)
+        os.replace(tmp_path, path)
 
     def save(self):
-        """Save progress, if Grader keeps track of a file."""
+        """Save progress, if Grader keeps track of a file.
+
+        This picks up grades from other graders, writes a full snapshot and
+        truncates the journal while holding the journal lock."""
 
         if self.path is not None:
-            self.save_to_path(self.path)
+            with self.journal.lock():
+                self.sync()
+                self.save_to_path(self.path)
+                self.journal.truncate()
+        if self.datastore is not None:
+            self.datastore.set_grades(self.exam, [
+                (id_, self.records[id_].grade, self.records[id_].timestamp)
+                for id_ in self.ids])
 
     def report(self):
         """Return a data frame with the grading job result."""
 
-        df = self.data.copy()
-        del df['__search']
+        columns = ['name', 'grade', 'timestamp'] + self.columns
+        rows = []
+        for id_ in self.ids:
+            record = self.records[id_]
+            rows.append([record.name, record.grade, record.timestamp] +
+                        [record.extra.get(col) for col in self.columns])
+        index = pd.Index(self.ids, name='id')
+        df = pd.DataFrame(rows, index=index, columns=columns)
+        df['grade'] = pd.to_numeric(df['grade'])
+        df['timestamp'] = pd.to_datetime(df['timestamp'])
         return df
 
+    def reset(self):
+        """Erase all grades and save the result."""
+
+        for record in self.records.values():
+            record.grade = None
+        self.save()
+
     def run(self):
         """Grader's mainloop."""
 
-        while True:
-            try:
-                self.step()
-                self.save()
-            except FinishGrading:
-                break
+        try:
+            while True:
+                try:
+                    self.step()
+                except FinishGrading:
+                    break
+                if self.journal and len(self.journal) >= self.compact_every:
+                    self.save()
+        finally:
+            self.save()
 
         if input('See grades? [Y/n] ').casefold() in ['y', '']:
             print(self.report())
@@ -147,31 +309,45 @@ class Grader:
 
         This performs a single step in the application's mainloop."""
 
+        self.__print_conflicts(self.sync())
         try:
             student_id = self.select()
-            student_name = self.data.loc[student_id, 'name']
+            student_name = self.records[student_id].name
             grade = self.get_value('%s (%s)' % (student_name, student_id))
         except CancelOperation:
             print('---')
             return self.step()
 
-        row = self.data.loc[student_id]
-        if pd.isnull(row['grade']):
-            self.data.loc[student_id, 'grade'] = grade
-            self.data.loc[student_id, 'timestamp'] = datetime.now()
+        # Other graders may have graded this student in the meantime
+        self.__print_conflicts(self.sync())
+        record = self.records[student_id]
+        if _isnull(record.grade):
+            self.set_grade(student_id, grade)
         else:
-            if grade == row['grade']:
+            if _same_grade(grade, record.grade):
                 pass
             else:
                 msg = '"%s" was already graded as %s. Overwrite? [y/N] '
-                response = input(msg % (row['name'], row['grade']))
+                response = input(msg % (record.name, record.grade))
                 if response.casefold() == 'y':
-                    self.data.loc[student_id, 'grade'] = grade
-                    self.data.loc[student_id, 'timestamp'] = datetime.now()
+                    self.set_grade(student_id, grade)
                     return print('---')
         print('grade registered!')
         print('---')
 
+    def set_grade(self, student_id, grade, timestamp=None):
+        """Register grade for the given student and record it in the
+        journal."""
+
+        timestamp = timestamp or datetime.now()
+        record = self.records[student_id]
+        record.grade = grade
+        record.timestamp = timestamp
+        if self.journal is not None:
+            self.journal.append(student_id, grade, timestamp)
+        if self.datastore is not None:
+            self.datastore.set_grade(self.exam, student_id, grade, timestamp)
+
     def get_value(self, name='student'):
         """Fetches a valid grade from the user."""
 
@@ -202,27 +378,32 @@ class Grader:
             else:
                 return self.select()
 
-        # Match name with list
+        # Match name with list. Fuzzy matches may be a different student
+        # and always require confirmation
+        matches = self.search_index.search(student, fuzzy=False)
+        if matches:
+            return self.pick_result(matches)
         matches = self.matches(student)
-        if not matches:
-            response = input('Not found!\nWant to add it [y/N]? ')
-            if response.casefold() == 'y':
-                return self.add_student(student)
-            else:
-                raise CancelOperation
+        if matches:
+            print('Not found! Did you mean:')
+            return self.pick_result(matches, confirm=True)
+        response = input('Not found!\nWant to add it [y/N]? ')
+        if response.casefold() == 'y':
+            return self.add_student(student)
         else:
-            result = self.pick_result(matches)
-        return result
+            raise CancelOperation
+
+    def pick_result(self, matches, confirm=False):
+        """Ask the user for a valid student from a list of `matches`.
 
-    def pick_result(self, matches):
-        """Ask the user for a valid student from a list of `matches`."""
+        A single match is selected automatically unless confirm=True."""
 
-        if len(matches) == 1:
+        if len(matches) == 1 and not confirm:
             return matches[0]
 
         # Display options
         for i, match in enumerate(matches):
-            descr = '%s (%s)' % (self.data['name'][match], match)
+            descr = '%s (%s)' % (self.records[match].name, match)
             print('    %s) %s' % (i + 1, descr))
         print('    Or press <enter> to restart or <0> to type a new id')
         response = input('Choose one: ')
@@ -250,11 +431,11 @@ class Grader:
             response = input('Bad response, try again: ')
 
     def matches(self, value):
-        """Return a list of all student ids that matches the given query."""
+        """Return a list of all student ids that matches the given query.
 
-        value = value.casefold()
-        data = zip(self.data.index, self.data['__search'])
-        return [idx for (idx, name) in data if value in name]
+        Matches are ranked and tolerate accents and small typos."""
+
+        return self.search_index.search(value)
 
     def add_student(self, student):
         """Add student id to the database and return its complete name."""
@@ -266,40 +447,154 @@ class Grader:
             except ValidationError:
                 student = input('Type name (id): ')
 
-        if id_ in self.data.index:
+        if id_ in self.records:
             print('student already exists!')
         else:
-            row = pd.DataFrame({
-                'name'     : name,
-                '__search' : '%s %s' % (name.casefold(), id_),
-                'timestamp': datetime.now(),
-            }, index=[id_])
-            self.data = self.data.append(row)
-            self.data.sort_index(inplace=True)
+            self.__insert_student(id_, name)
         return id_
 
+    def __convert_id(self, id_):
+        # Ids read from CSV files and journals follow the id type of the job,
+        # otherwise self.ids would mix types and could not be sorted
+        id_ = _pyvalue(id_)
+        try:
+            return self.id_type(id_)
+        except (TypeError, ValueError):
+            return id_
+
+    def __insert_student(self, id_, name, timestamp=None):
+        timestamp = timestamp or datetime.now()
+        self.records[id_] = Record(id_, name, timestamp=timestamp)
+        bisect.insort(self.ids, id_)
+        self.search_index.add(id_, '%s %s' % (name, id_))
+        if self.journal is not None:
+            self.journal.append(id_, None, timestamp, name)
+
+    def import_records(self, df, overwrite=False):
+        """Merge a table of grades into the grading job and save the result.
+
+        The table must have "id" and "grade" columns and an optional "name"
+        column. Ids accept the same "name (id)" notation of interactive
+        grading and grades are checked with validate_grade. All rows are
+        validated at once and nothing is imported if some row is invalid.
+        Unknown students are added to the job.
+
+        Students that were already graded with a different value (or appear
+        more than once in the table with different grades) are reported as
+        conflicts and are skipped unless overwrite=True.
+
+        Return an ImportResult(imported, added, conflicts, invalid) tuple in
+        which conflicts and invalid are data frames with offending rows.
+        """
+
+        df = pd.DataFrame(df).reset_index(drop=True)
+        if 'id' not in df or 'grade' not in df:
+            raise ValidationError('import table needs id and grade columns')
+        ids = df['id'].astype(str).str.strip()
+        names = df['name'] if 'name' in df else pd.Series(None, df.index)
+
+        # Split "name (id)" strings
+        parts = ids.str.extract(r'^(.*)\((.*)\)$')
+        has_parts = parts[0].notna()
+        names = names.where(names.notna() & ~has_parts, parts[0].str.strip())
+        ids = ids.where(~has_parts, parts[1].str.strip())
+        names = names.where(names.notna(), ids)
+
+        # Validate ids and grades in one pass
+        if self.id_type is int:
+            ids = pd.to_numeric(ids, errors='coerce')
+            bad_id = ids.isna() | (ids % 1 != 0)
+        else:
+            bad_id = ids.isna() | (ids == '')
+        grades = [self.__validate_import_grade(x) for x in df['grade']]
+        bad_grade = pd.Series([x is None for x in grades], df.index)
+        invalid = df[bad_id | bad_grade]
+        if len(invalid):
+            return ImportResult(0, 0, df.iloc[:0], invalid)
+
+        ids = [self.id_type(x) for x in ids]
+        table = pd.DataFrame({'id': ids, 'name': list(names),
+                              'grade': grades})
+
+        # Conflicts inside the imported table and against current grades
+        table['current'] = [getattr(self.records.get(id_), 'grade', None)
+                            for id_ in ids]
+        keys = table['grade'].map(_grade_key)
+        n_grades = keys.groupby(table['id']).transform('nunique')
+        differs = [not _isnull(current) and not _same_grade(current, grade)
+                   for current, grade in zip(table['current'], grades)]
+        conflict = (n_grades > 1) | pd.Series(differs, table.index)
+        conflicts = table[conflict]
+        if not overwrite:
+            table = table[~conflict]
+
+        # Apply all changes and save once
+        added = 0
+        timestamp = datetime.now()
+        journal, self.journal = self.journal, None
+        try:
+            for id_, name, grade in zip(table['id'], table['name'],
+                                        table['grade']):
+                if id_ not in self.records:
+                    self.__insert_student(id_, str(name), timestamp)
+                    added += 1
+                self.set_grade(id_, grade, timestamp)
+        finally:
+            self.journal = journal
+        self.save()
+        return ImportResult(len(table), added, conflicts, invalid)
+
+    def __validate_import_grade(self, value):
+        # Return None for grades rejected by validate_grade
+        if _isnull(value):
+            return None
+        try:
+            return self.validate_grade(str(value).strip())
+        except (ValueError, InvalidOperation, ValidationError):
+            return None
+
     def save_backup(self, path):
-        """Choose a proper .bak-X file to save. Cycle 5 times at most."""
+        """Save a snapshot of path in the backup/ folder next to it.
 
-        basepath, basename = os.path.split(os.path.abspath(path))
-        basepath = os.path.join(basepath, 'backup')
+        Snapshots are named after the file, the current time and a hash of
+        the contents. A new snapshot is not created if the newest one has the
+        same contents. Only the newest `self.backups` snapshots are kept.
 
+        Snapshots are copied by shutil.copyfile, which uses the fast
+        in-kernel copy routines of the OS. Hard links are not used since
+        other tools (and the datastore export) may write to the CSV file in
+        place. If `self.compress_backups` is True, snapshots are gzip
+        compressed instead."""
+
+        path = os.path.abspath(path)
+        basepath, basename = os.path.split(path)
+        basepath = os.path.join(basepath, 'backup')
         if not os.path.exists(basepath):
             os.mkdir(basepath)
 
-        for idx in range(5):
-            bak_name = os.path.join(basepath, '%s.bak-%s' % (path, idx))
-            if not os.path.exists(bak_name):
-                break
+        # Skip if contents did not change since the last snapshot
+        digest = _file_digest(path)[:12]
+        snapshots = _list_snapshots(basepath, basename)
+        if snapshots and _snapshot_digest(snapshots[-1]) == digest:
+            return os.path.join(basepath, snapshots[-1])
+
+        stamp = datetime.now().strftime('%Y%m%d-%H%M%S-%f')
+        bak_name = '%s.%s-%s' % (basename, stamp, digest)
+        bak_path = os.path.join(basepath, bak_name)
+        if self.compress_backups:
+            bak_path += '.gz'
+            with open(path, 'rb') as source:
+                with gzip.open(bak_path, 'wb') as destination:
+                    shutil.copyfileobj(source, destination)
         else:
-            for idx in range(4):
-                src = os.path.join(basepath, '%s.bak-%s' % (path, idx + 1))
-                dest = os.path.join(basepath, '%s.bak-%s' % (path, idx))
-                os.rename(src, dest)
+            shutil.copyfile(path, bak_path)
 
-        with open(path) as source:
-            with open(bak_name, 'w') as destination:
-                destination.writelines(source)
+        # Apply retention policy
+        if self.backups:
+            snapshots = _list_snapshots(basepath, basename)
+            for name in snapshots[:-self.backups]:
+                os.unlink(os.path.join(basepath, name))
+        return bak_path
 
     def __auto_validate_id(self, id_type=str):
         """Return a automatically created validation function for id fields.
@@ -331,11 +626,82 @@ class Grader:
 
         return validate
 
-    def __auto_validate_grade(self):
+    def __auto_validate_grade(self, validate_grade):
+        if validate_grade is not None:
+            return validate_grade
+
         def validator(x):
             try:
-                return Decimal(x)
-            except ValueError:
+                value = Decimal(x)
+            except (ValueError, InvalidOperation):
+                raise ValidationError
+            if not value.is_finite():
                 raise ValidationError
+            return value
 
         return validator
+
+
+def _isnull(value):
+    return value is None or value != value
+
+
+def _grade_key(grade):
+    # Grades loaded from CSV files are floats and typed grades are Decimals,
+    # hence we compare them by their decimal representation
+    return Decimal(str(_pyvalue(grade)))
+
+
+def _same_grade(a, b):
+    return _grade_key(a) == _grade_key(b)
+
+
+def _pyvalue(value):
+    # Convert numpy scalars read by pandas to plain Python values
+    try:
+        return value.item()
+    except AttributeError:
+        return value
+
+
+def read_grade_records(path):
+    """Read a table of grades from a CSV or NDJSON file.
+
+    Use path="-" to read from stdin. NDJSON is detected from the .ndjson or
+    .jsonl extensions or if the first character is a "{"."""
+
+    if path == '-':
+        data = sys.stdin.read()
+    else:
+        with open(path, encoding='utf8') as F:
+            data = F.read()
+
+    is_ndjson = path.endswith(('.ndjson', '.jsonl'))
+    if is_ndjson or data.lstrip().startswith('{'):
+        rows = [json.loads(line) for line in data.splitlines() if line.strip()]
+        return pd.DataFrame(rows)
+
+    return pd.read_csv(io.StringIO(data), dtype=str)
+
+
+def _file_digest(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as F:
+        for chunk in iter(lambda: F.read(1 << 16), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _list_snapshots(basepath, basename):
+    """Return a sorted list of snapshot names for the given file."""
+
+    regex = re.compile(r'^%s\.\d{8}-\d{6}-\d{6}-[0-9a-f]+(\.gz)?$'
+                       % re.escape(basename))
+    names = [name for name in os.listdir(basepath) if regex.match(name)]
+    return sorted(names, key=lambda x: x[len(basename):])
+
+
+def _snapshot_digest(name):
+    if name.endswith('.gz'):
+        name = name[:-3]
+    return name.rpartition('-')[-1]
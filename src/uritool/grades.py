@@ -0,0 +1,218 @@
+"""
+Vectorized grade aggregation over the progress of a whole discipline.
+"""
+import datetime
+from collections import namedtuple
+import numpy as np
+import pandas as pd
+
+__all__ = ['ProgressTensor', 'Change', 'diff_progress']
+
+# Constants
+change_fields = 'homework student problem old new time'.split()
+Change = namedtuple('Change', change_fields)
+
+
+class ProgressTensor:
+    """Progress of all students in all homeworks of a discipline.
+
+    Data is stored in a single students x homeworks x problems array of
+    scores in the 0-100 range. Homeworks have different numbers of problems,
+    hence a homeworks x problems boolean mask tells which slots correspond to
+    real problems. Unattempted problems are stored as nan.
+
+    All grading policies are computed as reductions over this array, so many
+    variants can be evaluated without rebuilding data frames.
+
+    Parameters
+    ----------
+
+    data : ndarray
+        Array of shape (students, homeworks, problems).
+    mask : ndarray
+        Boolean array of shape (homeworks, problems) marking valid problems.
+    students : sequence
+        Student ids (URI ids) for each row.
+    homeworks : sequence
+        Homework ids.
+    problems : list of lists
+        Column labels for the problems of each homework.
+    present : ndarray
+        Optional boolean array of shape (students, homeworks) telling if the
+        student is listed in each homework. Absent students receive nan
+        grades.
+    """
+
+    def __init__(self, data, mask, students, homeworks, problems,
+                 present=None):
+        self.data = np.asarray(data, dtype=float)
+        self.mask = np.asarray(mask, dtype=bool)
+        self.students = pd.Index(students, name='uri_id')
+        self.homeworks = list(homeworks)
+        self.problems = [list(x) for x in problems]
+        if present is None:
+            present = np.ones(self.data.shape[:2], dtype=bool)
+        self.present = np.asarray(present, dtype=bool)
+        self._grades = None
+
+    @classmethod
+    def from_frames(cls, frames, students=None):
+        """Create tensor from a mapping of homework ids to progress tables
+        as returned by :meth:`Discipline.progress`."""
+
+        homeworks = list(frames)
+        if students is None:
+            students = set()
+            for df in frames.values():
+                students.update(df.index)
+            students = sorted(students)
+        students = pd.Index(students, name='uri_id')
+        problems = [list(frames[hw].columns) for hw in homeworks]
+        size = max([len(x) for x in problems] or [0])
+
+        data = np.full((len(students), len(homeworks), size), np.nan)
+        mask = np.zeros((len(homeworks), size), dtype=bool)
+        present = np.zeros((len(students), len(homeworks)), dtype=bool)
+        for j, hw in enumerate(homeworks):
+            df = frames[hw]
+            rows = students.get_indexer(df.index)
+            found = rows >= 0
+            ncols = len(df.columns)
+            data[rows[found], j, :ncols] = df.values[found]
+            mask[j, :ncols] = True
+            present[rows[found], j] = True
+
+        return cls(data, mask, students, homeworks, problems, present)
+
+    def _compute_grades(self, rows=slice(None), cols=slice(None)):
+        data = np.nan_to_num(self.data[rows, cols], nan=0.0)
+        mask = self.mask[cols]
+        data[..., ~mask] = 0.0
+        with np.errstate(invalid='ignore', divide='ignore'):
+            grades = data.sum(-1) / mask.sum(-1)
+        return np.where(self.present[rows, cols], grades, np.nan)
+
+    def grade_array(self):
+        """Return a students x homeworks array with the average score in
+        each homework."""
+
+        if self._grades is None:
+            self._grades = self._compute_grades()
+        return self._grades.copy()
+
+    def update(self, homework, frame):
+        """Replace the progress table of a single homework and return an
+        index with the students whose progress changed.
+
+        Only the grades of those students are recomputed. Raises ValueError
+        if the table has students or problems that are not present in the
+        tensor. In that case, it must be rebuilt from scratch."""
+
+        j = self.homeworks.index(homework)
+        if list(frame.columns) != self.problems[j]:
+            raise ValueError('problem list changed for homework %s' % homework)
+        rows = self.students.get_indexer(frame.index)
+        if (rows < 0).any():
+            raise ValueError('new students in homework %s' % homework)
+
+        ncols = len(frame.columns)
+        new = np.full((len(self.students), ncols), np.nan)
+        new[rows] = frame.values
+        old = self.data[:, j, :ncols]
+        present = np.zeros(len(self.students), dtype=bool)
+        present[rows] = True
+
+        changed = _differs(old, new).any(1) | (present != self.present[:, j])
+        changed = np.flatnonzero(changed)
+        self.data[changed, j, :ncols] = new[changed]
+        self.present[changed, j] = present[changed]
+        if self._grades is not None and len(changed):
+            self._grades[changed, j] = self._compute_grades(changed, j)
+        return self.students[changed]
+
+    def grades(self):
+        """Return a data frame with the grade of each student (rows) in
+        each homework (columns)."""
+
+        return pd.DataFrame(self.grade_array(), index=self.students,
+                            columns=self.homeworks)
+
+    def weighted_average(self, weights=None, drop_lowest=0):
+        """Return a series with the weighted average of homework grades.
+
+        Parameters
+        ----------
+
+        weights : sequence or dict
+            Weight for each homework. Defaults to uniform weights. A dict
+            maps homework ids to weights; missing homeworks have weight 0.
+        drop_lowest : int
+            Number of lowest homework grades that are discarded for each
+            student before averaging.
+        """
+
+        grades = np.nan_to_num(self.grade_array(), nan=0.0)
+        weights = self._weights(weights)
+        weights = np.broadcast_to(weights, grades.shape).copy()
+
+        if drop_lowest:
+            order = np.argsort(grades, axis=1)[:, :drop_lowest]
+            np.put_along_axis(weights, order, 0.0, axis=1)
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            result = (grades * weights).sum(1) / weights.sum(1)
+        return pd.Series(result, index=self.students)
+
+    def solve_rates(self):
+        """Return a series with the fraction of students that solved each
+        problem, indexed by (homework, problem) pairs."""
+
+        solved = (self.data == 100) & self.present[:, :, None]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            rates = solved.sum(0) / self.present.sum(0)[:, None]
+
+        index, values = [], []
+        for j, hw in enumerate(self.homeworks):
+            for k, problem in enumerate(self.problems[j]):
+                index.append((hw, problem))
+                values.append(rates[j, k])
+        index = pd.MultiIndex.from_tuples(index, names=['homework', 'problem'])
+        return pd.Series(values, index=index, dtype=float)
+
+    def _weights(self, weights):
+        if weights is None:
+            return np.ones(len(self.homeworks))
+        if isinstance(weights, dict):
+            weights = [weights.get(hw, 0.0) for hw in self.homeworks]
+        weights = np.asarray(weights, dtype=float)
+        if weights.shape != (len(self.homeworks),):
+            raise ValueError('expect one weight per homework')
+        return weights
+
+
+def diff_progress(old, new, homework=None, time=None):
+    """Compare two progress tables for the same homework and return a list
+    of Change tuples for every (student, problem) cell that differs.
+
+    If old is None, every non-empty cell of the new table is reported.
+    Problems are identified by their numeric URI id."""
+
+    time = time or datetime.datetime.now()
+    if old is None:
+        old = new.iloc[:0]
+    old = old.reindex(index=new.index, columns=new.columns)
+    rows, cols = np.nonzero(_differs(old.values, new.values))
+
+    changes = []
+    for i, k in zip(rows, cols):
+        problem = int(str(new.columns[k]).partition(' ')[0])
+        change = Change(homework, new.index[i], problem, old.values[i, k],
+                        new.values[i, k], time)
+        changes.append(change)
+    return changes
+
+
+def _differs(old, new):
+    """Element-wise inequality that considers nan equal to nan."""
+
+    return (old != new) & ~(np.isnan(old) & np.isnan(new))
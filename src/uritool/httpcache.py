@@ -1,19 +1,35 @@
 """
 Retrieve and cache data from urls.
+
+Response bodies are stored only once in the cache, keyed by their content
+hash. Url entries hold the download date and the digest of the body (or an
+integer status code for failed requests). Bodies keep a reference count and
+are removed when no url refers to them anymore.
 """
-import requests
 import shelve
 import datetime
-from lxml import html as etree
+import hashlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from . import config
 from .util import debug_print
+from .profiling import span
 
 # URL Cache
 URLCACHE = None
-URLCACHEPATH = config.urlcache
+URLCACHEPATH = None
 MINUTE_DELTA = datetime.timedelta(minutes=1)
 INTERNET_SLOW = False
 
+# Error responses (e.g., 404) are cached for at most this number of minutes
+NEGATIVE_EXPIRES = 30
+BODY_PREFIX = 'body:'
+REFS_PREFIX = 'refs:'
+
+# Parsed HTML trees indexed by digest
+PARSED_CACHE_SIZE = 32
+_parsed = OrderedDict()
+
 
 def urlcache():
     """Return the global url cache object.
@@ -23,26 +39,129 @@ def urlcache():
 
     global URLCACHE
     if URLCACHE is None:
-        URLCACHE = shelve.open(URLCACHEPATH)
+        URLCACHE = shelve.open(URLCACHEPATH or config.urlcache)
     return URLCACHE
 
 
-def urlsave(url, data):
-    """Saves data for given url in cache."""
+def urlsave(url, data, date=None, sync=True):
+    """Saves data for given url in cache.
+
+    If the body did not change since the last download, only the date of the
+    url entry is updated. The date defaults to the current time."""
 
     cache = urlcache()
-    cache[url] = datetime.datetime.now(), data
+    old = cache.get(url, (None, None))[1]
+    if isinstance(data, str):
+        digest = _digest(data)
+        if digest != old:
+            _incref(cache, digest, data)
+            _decref(cache, old)
+        data = digest
+    else:
+        _decref(cache, old)
+    cache[url] = date or datetime.datetime.now(), data
+    if sync:
+        cache.sync()
+
+
+def urldelete(url):
+    """Remove url from cache and release its body."""
+
+    cache = urlcache()
+    try:
+        _, value = cache.pop(url)
+    except KeyError:
+        return
+    _decref(cache, value)
     cache.sync()
 
 
 def urlrefresh(url, *args, **kwds):
     """Refresh chache for the given url."""
 
-    cache = urlcache()
-    del cache[url]
+    urldelete(url)
     urlopen(url, *args, **kwds)
 
 
+def urlentry(url):
+    """Return a tuple of (date, data) for the given url or (None, None) if
+    url is not in cache."""
+
+    cache = urlcache()
+    try:
+        date, value = cache[url]
+    except KeyError:
+        return None, None
+    if isinstance(value, bytes):
+        return date, cache[BODY_PREFIX + value.hex()]
+    return date, value
+
+
+def urldigest(url):
+    """Return the hex digest of the body saved in cache for the given url.
+
+    Equal digests mean equal bodies, hence callers can use it to skip parsing
+    and change detection. Return None if the url is not in cache or if it is
+    an error page."""
+
+    try:
+        value = urlcache()[url][1]
+    except KeyError:
+        return None
+    if isinstance(value, str):
+        value = _digest(value)
+    return value.hex() if isinstance(value, bytes) else None
+
+
+def urlgc():
+    """Garbage collect the url cache.
+
+    Remove bodies not referred by any url, fix reference counts and move
+    bodies of entries saved by older versions of uritool to the content
+    addressed storage. Return a dictionary with statistics."""
+
+    cache = urlcache()
+    stats = dict(urls=0, bodies=0, removed=0, migrated=0)
+    refs = {}
+    body_keys = []
+    for key in list(cache.keys()):
+        if key.startswith(BODY_PREFIX):
+            body_keys.append(key)
+            continue
+        elif key.startswith(REFS_PREFIX):
+            continue
+        stats['urls'] += 1
+        date, value = cache[key]
+        if isinstance(value, str):
+            digest = _digest(value)
+            if BODY_PREFIX + digest.hex() not in cache:
+                cache[BODY_PREFIX + digest.hex()] = value
+                body_keys.append(BODY_PREFIX + digest.hex())
+            cache[key] = date, digest
+            stats['migrated'] += 1
+            value = digest
+        if isinstance(value, bytes):
+            refs[value.hex()] = refs.get(value.hex(), 0) + 1
+
+    for key in body_keys:
+        hexdigest = key[len(BODY_PREFIX):]
+        count = refs.get(hexdigest, 0)
+        if count:
+            stats['bodies'] += 1
+            if cache.get(REFS_PREFIX + hexdigest) != count:
+                cache[REFS_PREFIX + hexdigest] = count
+        else:
+            del cache[key]
+            cache.pop(REFS_PREFIX + hexdigest, None)
+            stats['removed'] += 1
+    for key in list(cache.keys()):
+        if (key.startswith(REFS_PREFIX)
+                and BODY_PREFIX + key[len(REFS_PREFIX):] not in cache):
+            del cache[key]
+    cache.sync()
+    return stats
+
+
 def urldate(url):
     """Return the date for the url saved in cache."""
 
@@ -52,7 +171,7 @@ def urldate(url):
         return None
 
 
-def urlopen(url, verbose=True, refresh=False, session=requests, expires=None,
+def urlopen(url, verbose=True, refresh=False, session=None, expires=None,
             **kwds):
     """Cached url opener. Return a string of data."""
 
@@ -60,11 +179,12 @@ def urlopen(url, verbose=True, refresh=False, session=requests, expires=None,
 
     # Retrieve from cache
     cache = urlcache()
-    cdate, data = cache.get(url, (None, None))
+    cdate, data = urlentry(url)
     if refresh:
         pass
     elif isinstance(data, int):
-        raise RuntimeError(data, url)
+        if urlfresh(url, expires):
+            raise RuntimeError(data, url)
     elif data is not None:
         if expires is None or INTERNET_SLOW:
             return data
@@ -77,21 +197,326 @@ def urlopen(url, verbose=True, refresh=False, session=requests, expires=None,
     debug_print(verbose, '  Fetching url: %s' % url)
     timeout = 10 if url in cache else 30
     try:
-        request = session.get(url, timeout=timeout, **kwds)
+        data = urlfetch(url, session=session, timeout=timeout, **kwds)
     except:
         INTERNET_SLOW = True
         if url in cache:
             debug_print(verbose, '  Internet too slow: using cache.')
+            return urlentry(url)[1]
         else:
             raise
-    data = request.status_code if request.status_code != 200 else request.text
     urlsave(url, data)
     return data
 
 
+def urlfetch(url, session=None, timeout=30, **kwds):
+    """Download url without touching the cache.
+
+    Return the response text or the integer status code for responses other
+    than 200."""
+
+    if session is None:
+        import requests as session
+    with span('fetch'):
+        request = session.get(url, timeout=timeout, **kwds)
+    return request.status_code if request.status_code != 200 else request.text
+
+
+def urlfresh(url, expires=None):
+    """Return True if url is in cache and is not older than expires
+    minutes.
+
+    Error responses expire after NEGATIVE_EXPIRES minutes, even if expires
+    is None."""
+
+    try:
+        cdate, data = urlcache()[url]
+    except KeyError:
+        return False
+    if isinstance(data, int):
+        expires = (NEGATIVE_EXPIRES if expires is None
+                   else min(expires, NEGATIVE_EXPIRES))
+    elif expires is None:
+        return True
+    return datetime.datetime.now() - cdate <= MINUTE_DELTA * expires
+
+
+def urlfetchmany(urls, session=None, workers=8, budget=None, expires=None,
+                 verbose=True):
+    """Fetch many urls concurrently and save them in cache.
+
+    Urls that are already fresh in cache (see :func:`urlfresh`) are skipped,
+    hence an interrupted job can simply be restarted. At most `budget` urls
+    are downloaded. Downloads run in a pool of `workers` threads, but the
+    cache is only written from the calling thread.
+
+    Return a dictionary mapping each downloaded url to its data. Urls that
+    raised errors are mapped to the exception."""
+
+    urls = [url for url in dict.fromkeys(urls) if not urlfresh(url, expires)]
+    if budget is not None:
+        urls = urls[:budget]
+    if not urls:
+        return {}
+
+    result = {}
+    with ThreadPoolExecutor(workers) as executor:
+        futures = {executor.submit(urlfetch, url, session): url
+                   for url in urls}
+        for future in as_completed(futures):
+            url = futures[future]
+            try:
+                data = future.result()
+            except Exception as ex:
+                msg = '  Error fetching url: %s (%s)' % (url, ex)
+                debug_print(verbose, msg)
+                result[url] = ex
+                continue
+            debug_print(verbose, '  Fetched url: %s' % url)
+            urlsave(url, data)
+            result[url] = data
+    return result
+
+
 def htmlopen(url, *args, **kwds):
-    """Like urlopen(), but returns parsed HTML."""
+    """Like urlopen(), but returns parsed HTML.
+
+    Pages with the same content share a single parsed tree, which must be
+    treated as read only."""
+
+    from lxml import html as etree
 
-    parser = etree.HTMLParser()
     data = urlopen(url, *args, **kwds)
-    return etree.fromstring(data, parser=parser)
+    if isinstance(data, int):
+        raise RuntimeError(data, url)
+    digest = _digest(data)
+    try:
+        _parsed.move_to_end(digest)
+        return _parsed[digest]
+    except KeyError:
+        pass
+    parser = etree.HTMLParser()
+    with span('parse'):
+        html = etree.fromstring(data, parser=parser)
+    _parsed[digest] = html
+    if len(_parsed) > PARSED_CACHE_SIZE:
+        _parsed.popitem(last=False)
+    return html
+
+
+def urlstream(url, tag=None, session=None, expires=None, refresh=False,
+              verbose=True, timeout=30, chunk_size=16 * 1024):
+    """Parse HTML incrementally and yield elements as soon as they are
+    complete.
+
+    Downloads are read in chunks with ``iter_content`` and fed to an lxml
+    pull parser, so parsing overlaps with the network transfer. The body is
+    saved in cache after the last chunk, hence a partially consumed stream
+    does not touch the cache. Cached pages follow the same rules as in
+    :func:`urlopen`.
+
+    Parameters
+    ----------
+
+    tag : str or sequence
+        Only yield elements with the given tag(s).
+
+    If the download fails before any element is yielded, the cached body is
+    used, if present.
+
+    Elements are yielded when their closing tag is parsed. The tree is still
+    being built, hence consumers may ``.clear()`` elements they have already
+    processed to reduce memory.
+    """
+
+    from lxml import etree
+    from lxml import html
+
+    global INTERNET_SLOW
+    parser = etree.HTMLPullParser(events=('end',), tag=tag)
+    parser.set_element_class_lookup(html.HtmlElementClassLookup())
+
+    if not refresh and (urlfresh(url, expires)
+                        or INTERNET_SLOW and url in urlcache()):
+        data = urlentry(url)[1]
+        if isinstance(data, int):
+            raise RuntimeError(data, url)
+        chunks = [data]
+    else:
+        chunks = _iter_body(url, session, timeout, chunk_size, verbose)
+
+    yielded = False
+    try:
+        for chunk in chunks:
+            with span('parse'):
+                parser.feed(chunk)
+                events = list(parser.read_events())
+            for _, elem in events:
+                yielded = True
+                yield elem
+    except OSError:
+        # Network errors (requests exceptions are OSErrors) fall back to the
+        # cached body, as in urlopen(). This is only possible if no element
+        # of the partial download was yielded yet.
+        INTERNET_SLOW = True
+        data = urlentry(url)[1]
+        if yielded or not isinstance(data, str):
+            raise
+        debug_print(verbose, '  Internet too slow: using cache.')
+        parser = etree.HTMLPullParser(events=('end',), tag=tag)
+        parser.set_element_class_lookup(html.HtmlElementClassLookup())
+        parser.feed(data)
+        for _, elem in parser.read_events():
+            yield elem
+    parser.close()
+    for _, elem in parser.read_events():
+        yield elem
+
+
+def _iter_body(url, session, timeout, chunk_size, verbose):
+    # Yield decoded chunks of the response body and save it in cache at the
+    # end. Error responses are saved and raise a RuntimeError.
+    import codecs
+
+    if session is None:
+        import requests as session
+
+    debug_print(verbose, '  Streaming url: %s' % url)
+    with span('fetch'):
+        response = session.get(url, timeout=timeout, stream=True)
+    if response.status_code != 200:
+        urlsave(url, response.status_code)
+        raise RuntimeError(response.status_code, url)
+
+    decoder = codecs.getincrementaldecoder(response.encoding or 'utf-8')(
+        errors='replace')
+    parts = []
+    for block in response.iter_content(chunk_size):
+        text = decoder.decode(block)
+        parts.append(text)
+        yield text
+    parts.append(decoder.decode(b'', final=True))
+    yield parts[-1]
+    urlsave(url, ''.join(parts))
+
+
+#
+# Cache bundles
+#
+BUNDLE_FORMAT = 'uritool-cache'
+BUNDLE_VERSION = 1
+
+
+def urlexport(path, pattern=None, since=None):
+    """Export cache entries to a gzip compressed bundle.
+
+    The bundle is a stream of JSON lines. The first line is a header with
+    the format name and version and each following line holds the url,
+    fetched_at date, status (for error responses) and body of a cache entry.
+
+    Parameters
+    ----------
+
+    path : str
+        Output file or "-" for stdout.
+    pattern : str
+        Only export urls matching this glob pattern (e.g., "*/profile/*").
+    since : datetime
+        Only export entries fetched after this date.
+
+    Return the number of exported entries.
+    """
+
+    import fnmatch
+    import gzip
+    import json
+    import sys
+
+    cache = urlcache()
+    header = {'format': BUNDLE_FORMAT, 'version': BUNDLE_VERSION,
+              'created': datetime.datetime.now().isoformat()}
+    fd = sys.stdout.buffer if path == '-' else open(path, 'wb')
+    count = 0
+    with gzip.open(fd, 'wt', encoding='utf8') as file:
+        file.write(json.dumps(header) + '\n')
+        for url in cache.keys():
+            if url.startswith((BODY_PREFIX, REFS_PREFIX)):
+                continue
+            if pattern and not fnmatch.fnmatchcase(url, pattern):
+                continue
+            date, data = urlentry(url)
+            if since and date < since:
+                continue
+            entry = {'url': url, 'fetched_at': date.isoformat(),
+                     'status': data if isinstance(data, int) else None,
+                     'body': data if isinstance(data, str) else None}
+            file.write(json.dumps(entry) + '\n')
+            count += 1
+    if fd is not sys.stdout.buffer:
+        fd.close()
+    return count
+
+
+def urlimport(path):
+    """Merge a bundle created by :func:`urlexport` into the cache.
+
+    Entries are read one at a time and only replace cached entries that
+    were fetched before them. Return a tuple (imported, skipped)."""
+
+    import gzip
+    import json
+    import sys
+
+    cache = urlcache()
+    fd = sys.stdin.buffer if path == '-' else open(path, 'rb')
+    imported = skipped = 0
+    with gzip.open(fd, 'rt', encoding='utf8') as file:
+        header = json.loads(file.readline() or '{}')
+        if header.get('format') != BUNDLE_FORMAT:
+            raise ValueError('not a uritool cache bundle: %s' % path)
+        if header.get('version', 0) > BUNDLE_VERSION:
+            raise ValueError('unsupported bundle version: %s'
+                             % header['version'])
+        for line in file:
+            entry = json.loads(line)
+            url = entry['url']
+            date = datetime.datetime.fromisoformat(entry['fetched_at'])
+            if url in cache and cache[url][0] >= date:
+                skipped += 1
+                continue
+            data = entry['status']
+            if data is None:
+                data = entry['body']
+            urlsave(url, data, date, sync=False)
+            imported += 1
+    cache.sync()
+    if fd is not sys.stdin.buffer:
+        fd.close()
+    return imported, skipped
+
+
+#
+# Content addressed storage
+#
+def _digest(data):
+    return hashlib.sha1(data.encode('utf8')).digest()
+
+
+def _incref(cache, digest, data):
+    key = digest.hex()
+    refs = cache.get(REFS_PREFIX + key, 0)
+    if not refs or BODY_PREFIX + key not in cache:
+        cache[BODY_PREFIX + key] = data
+    cache[REFS_PREFIX + key] = refs + 1
+
+
+def _decref(cache, value):
+    if not isinstance(value, bytes):
+        return
+    key = value.hex()
+    refs = cache.get(REFS_PREFIX + key, 1) - 1
+    if refs <= 0:
+        cache.pop(BODY_PREFIX + key, None)
+        cache.pop(REFS_PREFIX + key, None)
+    else:
+        cache[REFS_PREFIX + key] = refs
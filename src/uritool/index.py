@@ -0,0 +1,255 @@
+"""
+Inverted indexes over collected submissions.
+"""
+
+__all__ = ['ProblemIndex', 'StudentSet']
+
+
+class StudentSet:
+    """An immutable set of students backed by a packed bitset.
+
+    Instances are returned by ProblemIndex queries and support the usual set
+    operators (``&``, ``|``, ``-`` and ``^``) against other sets from the same
+    index. Iteration yields students in sorted order.
+    """
+
+    __slots__ = ('_index', '_mask')
+
+    def __init__(self, index, mask=0):
+        self._index = index
+        self._mask = mask
+
+    def __len__(self):
+        return bin(self._mask).count('1')
+
+    def __bool__(self):
+        return bool(self._mask)
+
+    def __iter__(self):
+        return iter(sorted(self._index._iter_students(self._mask)))
+
+    def __contains__(self, student):
+        try:
+            slot = self._index._student_slot[student]
+        except KeyError:
+            return False
+        return bool(self._mask >> slot & 1)
+
+    def __eq__(self, other):
+        if isinstance(other, StudentSet):
+            return self._mask == other._mask and self._index is other._index
+        return set(self) == other
+
+    def __repr__(self):
+        return 'StudentSet(%s)' % list(self)
+
+    def __and__(self, other):
+        return StudentSet(self._index, self._mask & self._other_mask(other))
+
+    def __or__(self, other):
+        return StudentSet(self._index, self._mask | self._other_mask(other))
+
+    def __sub__(self, other):
+        return StudentSet(self._index, self._mask & ~self._other_mask(other))
+
+    def __xor__(self, other):
+        return StudentSet(self._index, self._mask ^ self._other_mask(other))
+
+    def _other_mask(self, other):
+        if isinstance(other, StudentSet):
+            if other._index is not self._index:
+                raise ValueError('cannot combine sets from different indexes')
+            return other._mask
+        return self._index._students_mask(other)
+
+
+class ProblemIndex:
+    """Inverted index between students and the problems they solved.
+
+    Each student and each problem is assigned a slot when first seen. Problems
+    keep a bitset of the students that solved them and students keep a bitset
+    of the solved problems, so that queries such as "who solved 1001 but not
+    1002" reduce to a few bitwise operations instead of rescanning every
+    submission list::
+
+        >>> index = ProblemIndex({1: [1001, 1002], 2: [1001]})
+        >>> list(index.solvers(1001) - index.solvers(1002))
+        [2]
+
+    Parameters
+    ----------
+
+    D : dict
+        Optional mapping from students to a sequence of Problem objects (or
+        plain problem ids) used to populate the index.
+    """
+
+    def __init__(self, D=None):
+        self._students = []
+        self._student_slot = {}
+        self._problems = []
+        self._problem_slot = {}
+        self._by_problem = []
+        self._by_student = []
+        if D:
+            self.update(D)
+
+    def __len__(self):
+        return len(self._students)
+
+    def __contains__(self, student):
+        return student in self._student_slot
+
+    def add(self, student, problems=()):
+        """Register the given problems as solved by student.
+
+        This can be called repeatedly as new submissions arrive: problems are
+        merged with the ones already registered for the student."""
+
+        slot = self._add_student(student)
+        bit = 1 << slot
+        mask = self._by_student[slot]
+        for problem in problems:
+            problem_slot = self._add_problem(getattr(problem, 'id', problem))
+            mask |= 1 << problem_slot
+            self._by_problem[problem_slot] |= bit
+        self._by_student[slot] = mask
+
+    def update(self, D):
+        """Add all students and problems from a students to problems
+        mapping."""
+
+        for student, problems in D.items():
+            self.add(student, problems)
+
+    def students(self):
+        """Return a sorted list of all indexed students."""
+
+        return sorted(self._students)
+
+    def problems(self):
+        """Return a sorted list of all problems solved by some student."""
+
+        return sorted(self._problems)
+
+    def all(self):
+        """Return a StudentSet with all indexed students."""
+
+        return StudentSet(self, (1 << len(self._students)) - 1)
+
+    def solvers(self, problem):
+        """Return the StudentSet of students that solved the given problem."""
+
+        try:
+            mask = self._by_problem[self._problem_slot[problem]]
+        except KeyError:
+            mask = 0
+        return StudentSet(self, mask)
+
+    def solved_all(self, problems):
+        """Return the StudentSet of students that solved all problems."""
+
+        result = self.all()
+        for problem in problems:
+            result &= self.solvers(problem)
+        return result
+
+    def solved_any(self, problems):
+        """Return the StudentSet of students that solved at least one of the
+        given problems."""
+
+        result = StudentSet(self)
+        for problem in problems:
+            result |= self.solvers(problem)
+        return result
+
+    def solved(self, student):
+        """Return a sorted list of problems solved by the given student."""
+
+        try:
+            mask = self._by_student[self._student_slot[student]]
+        except KeyError:
+            return []
+        return sorted(self._problems[i] for i in _iter_bits(mask))
+
+    def has_solved(self, student, problem):
+        """Return True if student solved the given problem."""
+
+        try:
+            mask = self._by_problem[self._problem_slot[problem]]
+            return bool(mask >> self._student_slot[student] & 1)
+        except KeyError:
+            return False
+
+    def count(self, problem):
+        """Return the number of students that solved the given problem."""
+
+        return len(self.solvers(problem))
+
+    def counts(self, problems=None):
+        """Return a dictionary mapping each problem to its number of
+        solvers."""
+
+        if problems is None:
+            problems = self.problems()
+        return {problem: self.count(problem) for problem in problems}
+
+    def count_solved(self, student, problems=None):
+        """Return the number of problems solved by student.
+
+        If problems is given, only count problems in that list."""
+
+        try:
+            mask = self._by_student[self._student_slot[student]]
+        except KeyError:
+            return 0
+        if problems is not None:
+            mask &= self._problems_mask(problems)
+        return bin(mask).count('1')
+
+    #
+    # Private methods
+    #
+    def _add_student(self, student):
+        try:
+            return self._student_slot[student]
+        except KeyError:
+            slot = self._student_slot[student] = len(self._students)
+            self._students.append(student)
+            self._by_student.append(0)
+            return slot
+
+    def _add_problem(self, problem):
+        try:
+            return self._problem_slot[problem]
+        except KeyError:
+            slot = self._problem_slot[problem] = len(self._problems)
+            self._problems.append(problem)
+            self._by_problem.append(0)
+            return slot
+
+    def _iter_students(self, mask):
+        return (self._students[i] for i in _iter_bits(mask))
+
+    def _students_mask(self, students):
+        mask = 0
+        for student in students:
+            if student in self._student_slot:
+                mask |= 1 << self._student_slot[student]
+        return mask
+
+    def _problems_mask(self, problems):
+        mask = 0
+        for problem in problems:
+            if problem in self._problem_slot:
+                mask |= 1 << self._problem_slot[problem]
+        return mask
+
+
+def _iter_bits(mask):
+    """Iterate over the positions of all set bits in mask."""
+
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
@@ -0,0 +1,219 @@
+"""
+Append-only journal of grade events.
+"""
+import os
+import json
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from decimal import Decimal
+
+try:
+    import fcntl
+except ImportError:  # Windows: no locking and no concurrent graders
+    fcntl = None
+
+__all__ = ['Journal']
+
+
+class Journal:
+    """Append-only log of grading events kept next to a CSV snapshot.
+
+    Each event is stored as a JSON object in its own line. Writes are flushed
+    immediately, but only synced to disk every `sync_every` events or
+    `sync_interval` seconds, whatever happens first. After the owner saves a
+    full snapshot, the journal can be truncated.
+
+    Several processes may share the same journal. Writes, reads and
+    truncation are protected by an exclusive lock on ``path + '.lock'``
+    and each event records the id of the journal that wrote it, so that
+    :meth:`read_new` only returns events written by other processes.
+
+    Parameters
+    ----------
+
+    path : str
+        Path to the journal file. It is created on the first write.
+    sync_every : int
+        Maximum number of events that are not fsync'ed to disk.
+    sync_interval : float
+        Maximum time (in seconds) between two fsync calls.
+    writer : str
+        Unique identifier of the writer. A random one is created if not
+        given.
+    """
+
+    def __init__(self, path, sync_every=10, sync_interval=5.0, writer=None):
+        self.path = path
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self.writer = writer or '%s-%s' % (os.environ.get('USER', 'grader'),
+                                           uuid.uuid4().hex[:8])
+        self._file = None
+        self._pending = 0
+        self._last_sync = time.monotonic()
+        self._size = 0
+        self._offset = 0
+        self._inode = None
+        self._lock_file = None
+        self._lock_depth = 0
+
+    def __len__(self):
+        """Number of events written since the journal was last truncated."""
+
+        return self._size
+
+    @contextmanager
+    def lock(self):
+        """Context manager that holds an exclusive lock on the journal.
+
+        The lock is reentrant within the same Journal object."""
+
+        if fcntl is None:
+            yield
+            return
+
+        if self._lock_depth == 0:
+            self._lock_file = open(self.path + '.lock', 'a')
+            fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX)
+        self._lock_depth += 1
+        try:
+            yield
+        finally:
+            self._lock_depth -= 1
+            if self._lock_depth == 0:
+                fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_UN)
+                self._lock_file.close()
+                self._lock_file = None
+
+    def append(self, id_, grade=None, timestamp=None, name=None):
+        """Append a grading event to the journal."""
+
+        timestamp = timestamp or datetime.now()
+        record = {
+            'id'       : _jsonable(id_),
+            'name'     : name,
+            'grade'    : None if grade is None else str(grade),
+            'timestamp': timestamp.isoformat(),
+            'writer'   : self.writer,
+        }
+        with self.lock():
+            # Reopen if some other process truncated the journal
+            if self._file is not None:
+                if os.fstat(self._file.fileno()).st_ino != _inode(self.path):
+                    self.close()
+            if self._file is None:
+                self._file = open(self.path, 'a', encoding='utf8')
+            self._file.write(json.dumps(record) + '\n')
+            self._file.flush()
+        self._size += 1
+        self._pending += 1
+
+        elapsed = time.monotonic() - self._last_sync
+        if self._pending >= self.sync_every or elapsed >= self.sync_interval:
+            self.sync()
+
+    def sync(self):
+        """Force pending events to disk."""
+
+        if self._file is not None and self._pending:
+            os.fsync(self._file.fileno())
+        self._pending = 0
+        self._last_sync = time.monotonic()
+
+    def replay(self):
+        """Iterate over all events stored in the journal.
+
+        Yield dictionaries with the "id", "name", "grade" and "timestamp" keys.
+        Grades are converted to Decimal and timestamps to datetime objects. A
+        partially written last line (e.g., after a crash) is ignored."""
+
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'rb') as F:
+            for line in F:
+                try:
+                    yield _parse(line)
+                except ValueError:
+                    break
+
+    def read_new(self):
+        """Return a tuple (records, truncated) with the events that other
+        writers appended since the last call.
+
+        If truncated is True, some other writer truncated the journal after
+        saving a snapshot. Events written before truncation are not
+        returned and must be read from the snapshot."""
+
+        with self.lock():
+            inode = _inode(self.path)
+            truncated = self._inode is not None and inode != self._inode
+            if truncated:
+                self._offset = 0
+            self._inode = inode
+            if inode is None:
+                return [], truncated
+            with open(self.path, 'rb') as F:
+                F.seek(self._offset)
+                data = F.read()
+            self._offset += len(data)
+
+        records = []
+        for line in data.splitlines():
+            try:
+                record = _parse(line)
+            except ValueError:
+                continue
+            if record.get('writer') != self.writer:
+                records.append(record)
+        return records, truncated
+
+    def truncate(self):
+        """Discard all events. Should be called after saving a snapshot."""
+
+        with self.lock():
+            self.close()
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w'):
+                pass
+            os.replace(tmp_path, self.path)
+            self._inode = _inode(self.path)
+            self._offset = 0
+        self._size = 0
+
+    def close(self):
+        """Sync and close the journal file."""
+
+        if self._file is not None:
+            self.sync()
+            self._file.close()
+            self._file = None
+
+
+def _parse(line):
+    record = json.loads(line.decode('utf8'))
+    if record['grade'] is not None:
+        record['grade'] = Decimal(record['grade'])
+    record['timestamp'] = _fromisoformat(record['timestamp'])
+    return record
+
+
+def _inode(path):
+    try:
+        return os.stat(path).st_ino
+    except FileNotFoundError:
+        return None
+
+
+def _jsonable(value):
+    # Convert numpy scalars (e.g., values taken from a pandas index)
+    try:
+        return value.item()
+    except AttributeError:
+        return value
+
+
+def _fromisoformat(st):
+    fmt = '%Y-%m-%dT%H:%M:%S.%f' if '.' in st else '%Y-%m-%dT%H:%M:%S'
+    return datetime.strptime(st, fmt)
@@ -0,0 +1,74 @@
+"""
+Warm the url cache with all pages needed to grade a discipline.
+"""
+from .httpcache import urlfetchmany, urlfresh
+from .util import debug_print
+
+__all__ = ['prefetch']
+
+
+def prefetch(discipline, workers=8, budget=None, expires=60, verbose=True,
+             profiles=True, closed=True):
+    """Download all pages related to the given discipline into the url cache.
+
+    It fetches the discipline page, the progress and details pages of all
+    homeworks and all pages of the public profiles of enrolled students. The
+    first page of each profile tells how many pages must be fetched.
+
+    Parameters
+    ----------
+
+    discipline : Discipline or list
+        A :class:`uritool.urilib.Discipline` instance or a list of
+        disciplines. Pages of all disciplines are fetched in a single pool
+        using the session of the first discipline.
+    workers : int
+        Number of concurrent downloads.
+    budget : int
+        Maximum number of pages downloaded in this run. Pages that were not
+        downloaded are fetched in the next run.
+    expires : float
+        Pages fetched less than this number of minutes ago are skipped. This
+        allows resuming interrupted jobs.
+    profiles : bool
+        If False, skip the public profiles of students.
+    closed : bool
+        If False, skip homeworks whose deadline has passed.
+
+    Returns
+    -------
+
+    A tuple (fetched, failed) with the number of downloaded and failed urls.
+    """
+
+    disciplines = discipline if isinstance(discipline, list) else [discipline]
+
+    # The discipline page must be read to enumerate the remaining pages
+    urls = []
+    for discipline in disciplines:
+        urls.extend(discipline.urls(profiles=profiles, closed=closed))
+    debug_print(verbose, 'Prefetching %s urls for discipline %s' %
+                (len(urls), ', '.join(str(d.pk) for d in disciplines)))
+    session = disciplines[0].session
+    result = urlfetchmany(urls, session=session, workers=workers,
+                          budget=budget, expires=expires, verbose=verbose)
+
+    # Remaining pages of profiles whose first page is in cache
+    if profiles and (budget is None or budget > len(result)):
+        from .urilib import PROFILE_URL, profile_urls
+
+        urls = []
+        for discipline in disciplines:
+            for id_ in discipline.students.index:
+                if not urlfresh(PROFILE_URL % (id_, 1)):
+                    continue
+                try:
+                    urls.extend(profile_urls(id_, verbose=False)[1:])
+                except RuntimeError:
+                    continue
+        budget = None if budget is None else budget - len(result)
+        result.update(urlfetchmany(urls, session=session, workers=workers,
+                                   budget=budget, expires=expires,
+                                   verbose=verbose))
+    failed = sum(isinstance(x, Exception) for x in result.values())
+    return len(result) - failed, failed
@@ -0,0 +1,138 @@
+"""
+Timing spans and whole program profiling.
+
+The :func:`span` context manager is cheap enough to stay in production code.
+It accumulates the number of calls and the total wall time of named phases
+(e.g., "fetch", "parse", "extract") in the module level SPANS dictionary.
+
+The :func:`profile` context manager runs a block of code under cProfile or
+tracemalloc and writes a dump that can be inspected later.
+"""
+import contextlib
+import datetime
+import threading
+import time
+
+__all__ = ['span', 'profile', 'spans_summary', 'reset_spans', 'SPANS']
+
+# Maps span names to [count, total seconds]
+SPANS = {}
+PROFILE_KINDS = ['cpu', 'mem']
+_lock = threading.Lock()
+
+
+@contextlib.contextmanager
+def span(name):
+    """Measure the wall time spent inside the with block and add it to the
+    totals of the given span name."""
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        with _lock:
+            stats = SPANS.setdefault(name, [0, 0.0])
+            stats[0] += 1
+            stats[1] += elapsed
+
+
+def reset_spans():
+    """Discard all recorded span timings."""
+
+    with _lock:
+        SPANS.clear()
+
+
+def spans_summary():
+    """Return a string with a table of recorded spans sorted by total
+    time."""
+
+    with _lock:
+        items = sorted(SPANS.items(), key=lambda x: x[1][1], reverse=True)
+    lines = ['%-20s %8s %12s %12s' % ('span', 'calls', 'total (s)',
+                                      'mean (ms)')]
+    for name, (calls, total) in items:
+        lines.append('%-20s %8d %12.3f %12.2f' % (
+            name, calls, total, 1000 * total / calls))
+    return '\n'.join(lines)
+
+
+@contextlib.contextmanager
+def profile(kind='cpu', path=None, top=20, file=None):
+    """Profile the code inside the with block.
+
+    Parameters
+    ----------
+
+    kind : 'cpu' or 'mem'
+        The 'cpu' profile uses cProfile and saves a pstats dump that can be
+        read with the pstats module or converted to a flamegraph with tools
+        such as flameprof or snakeviz. The 'mem' profile uses tracemalloc
+        and saves a snapshot that can be loaded with
+        tracemalloc.Snapshot.load().
+    path : str
+        Output file. Defaults to uritool-<timestamp>.prof (cpu) or
+        uritool-<timestamp>.tracemalloc (mem).
+    top : int
+        Number of entries in the summary printed at the end.
+    file :
+        Stream that receives the summary (defaults to sys.stderr).
+    """
+
+    import sys
+
+    if kind not in PROFILE_KINDS:
+        raise ValueError('invalid profile kind: %r' % kind)
+    file = file or sys.stderr
+    if path is None:
+        now = datetime.datetime.now().strftime('%Y%m%d-%H%M%S')
+        ext = 'prof' if kind == 'cpu' else 'tracemalloc'
+        path = 'uritool-%s.%s' % (now, ext)
+
+    reset_spans()
+    if kind == 'cpu':
+        with _cpu_profile(path, top, file):
+            yield path
+    else:
+        with _mem_profile(path, top, file):
+            yield path
+    if SPANS:
+        print('\nTiming spans:', file=file)
+        print(spans_summary(), file=file)
+    print('\nProfile saved to %s' % path, file=file)
+
+
+@contextlib.contextmanager
+def _cpu_profile(path, top, file):
+    import cProfile
+    import pstats
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
+        stats = pstats.Stats(profiler, stream=file)
+        stats.sort_stats('cumulative').print_stats(top)
+
+
+@contextlib.contextmanager
+def _mem_profile(path, top, file):
+    import tracemalloc
+
+    tracemalloc.start(25)
+    try:
+        yield
+    finally:
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        snapshot.dump(path)
+        print('Memory: current %.1f KiB, peak %.1f KiB' % (
+            current / 1024, peak / 1024), file=file)
+        print('Top %s allocations:' % top, file=file)
+        for stat in snapshot.statistics('lineno')[:top]:
+            print('  %s' % stat, file=file)
@@ -0,0 +1,175 @@
+"""
+Deadline driven refresh of homework progress.
+"""
+import heapq
+import sys
+import time
+import datetime
+from itertools import count
+
+__all__ = ['RefreshScheduler']
+
+
+class RefreshScheduler:
+    """Priority queue of due homework refreshes.
+
+    Open homeworks are polled at intervals proportional to the time left
+    until their deadline, so polling gets more frequent as the deadline
+    approaches. Each homework is refreshed one last time after its deadline
+    and then dropped from the queue. Refresh requests for a homework that is
+    already in the queue are coalesced into a single entry.
+
+    Parameters
+    ----------
+
+    refresh : callable
+        Function called with the homework id to perform a refresh.
+    min_interval, max_interval : float
+        Bounds (in minutes) of the interval between two refreshes of the same
+        homework.
+    ratio : float
+        Fraction of the remaining time until the deadline used as the polling
+        interval.
+    clock : callable
+        Function that returns the current datetime.
+    sleep : callable
+        Function that sleeps for the given number of seconds.
+    """
+
+    def __init__(self, refresh, min_interval=5, max_interval=120, ratio=0.25,
+                 clock=datetime.datetime.now, sleep=time.sleep):
+        self.refresh = refresh
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.ratio = ratio
+        self.clock = clock
+        self.sleep = sleep
+        self.deadlines = {}
+        self.closed = set()
+        self._queue = []
+        self._pending = {}
+        self._counter = count()
+
+    def __len__(self):
+        return len(self._pending)
+
+    def __contains__(self, homework):
+        return homework in self._pending
+
+    def interval(self, deadline, now=None):
+        """Return the time until the next refresh of a homework with the
+        given deadline or None if the homework is closed."""
+
+        now = now or self.clock()
+        remaining = (deadline - now).total_seconds() / 60
+        if remaining <= 0:
+            return None
+        minutes = min(max(remaining * self.ratio, self.min_interval),
+                      self.max_interval)
+        if remaining - minutes < self.min_interval:
+            minutes = remaining
+        return datetime.timedelta(minutes=minutes)
+
+    def schedule(self, homework, deadline, when=None):
+        """Register homework and schedule its next refresh.
+
+        If when is not given, the first refresh is due immediately. If the
+        homework is already in the queue, its refresh is only moved to the
+        earliest of both times. Homeworks that closed more than max_interval
+        minutes ago are not scheduled and the method returns False."""
+
+        now = self.clock()
+        grace = datetime.timedelta(minutes=self.max_interval)
+        if deadline < now - grace:
+            return False
+        self.deadlines[homework] = deadline
+        if deadline <= now:
+            self.closed.add(homework)
+        self._push(homework, when or now)
+        return True
+
+    def request(self, homework):
+        """Request an immediate refresh of the given homework.
+
+        Requests for homeworks that are already due are coalesced. Raises
+        ValueError if the homework was not registered with schedule()."""
+
+        if homework not in self.deadlines:
+            raise ValueError('homework %r is not scheduled' % (homework,))
+        self._push(homework, self.clock())
+
+    def next_time(self):
+        """Return the time of the next due refresh or None if the queue is
+        empty."""
+
+        self._discard_stale()
+        return self._queue[0][0] if self._queue else None
+
+    def run_pending(self):
+        """Execute all due refreshes and reschedule them.
+
+        Failed refreshes are reported to stderr and retried after
+        min_interval minutes, until max_interval minutes past the deadline.
+        Return the list of refreshed homeworks."""
+
+        now = self.clock()
+        done = []
+        while self.next_time() is not None and self.next_time() <= now:
+            _, _, homework = heapq.heappop(self._queue)
+            del self._pending[homework]
+            try:
+                self.refresh(homework)
+            except Exception as ex:
+                print('warning: could not refresh homework %s: %s' %
+                      (homework, ex), file=sys.stderr)
+                self._retry(homework)
+                continue
+            done.append(homework)
+
+            interval = self.interval(self.deadlines[homework], self.clock())
+            if interval is not None:
+                self._push(homework, self.clock() + interval)
+            elif homework not in self.closed:
+                # A final refresh shortly after the deadline catches the
+                # last submissions
+                self.closed.add(homework)
+                grace = datetime.timedelta(minutes=self.min_interval)
+                self._push(homework, self.clock() + grace)
+        return done
+
+    def run(self, until=None):
+        """Run refreshes until the queue is empty or until the given
+        datetime."""
+
+        while True:
+            when = self.next_time()
+            if when is None or (until is not None and when > until):
+                return
+            delay = (when - self.clock()).total_seconds()
+            if delay > 0:
+                self.sleep(delay)
+            self.run_pending()
+
+    #
+    # Private methods
+    #
+    def _push(self, homework, when):
+        current = self._pending.get(homework)
+        if current is not None and current <= when:
+            return
+        self._pending[homework] = when
+        heapq.heappush(self._queue, (when, next(self._counter), homework))
+
+    def _retry(self, homework):
+        now = self.clock()
+        grace = datetime.timedelta(minutes=self.max_interval)
+        if now < self.deadlines[homework] + grace:
+            retry = datetime.timedelta(minutes=self.min_interval)
+            self._push(homework, now + retry)
+
+    def _discard_stale(self):
+        # Remove entries that were superseded by an earlier refresh
+        queue = self._queue
+        while queue and self._pending.get(queue[0][2]) != queue[0][0]:
+            heapq.heappop(queue)
+
@@ -0,0 +1,134 @@
+"""
+Fuzzy search over student names and ids.
+"""
+import unicodedata
+from collections import defaultdict
+
+__all__ = ['SearchIndex', 'fold']
+
+
+def fold(text):
+    """Normalize text for searching: strip accents, casefold and collapse
+    whitespace."""
+
+    text = unicodedata.normalize('NFKD', str(text))
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    return ' '.join(text.casefold().split())
+
+
+def trigrams(text):
+    """Return the set of trigrams of each word in a folded text.
+
+    Words are padded with two spaces at the beginning and one at the end, so
+    short queries still produce trigrams that match word prefixes."""
+
+    result = set()
+    for word in text.split():
+        word = '  %s ' % word
+        result.update(word[i:i + 3] for i in range(len(word) - 2))
+    return result
+
+
+class SearchIndex:
+    """Trigram index that maps search strings to arbitrary keys.
+
+    Queries are folded (see :func:`fold`) and matched against the indexed
+    texts. Texts that contain the query as a substring are returned first.
+    If there is no such text, texts that share most of the query trigrams
+    are returned, which tolerates small typos.
+
+    Parameters
+    ----------
+
+    items : iterable
+        Sequence of (key, text) pairs used to populate the index.
+    threshold : float
+        Minimum fraction of the query trigrams a text must contain to be
+        returned as a fuzzy match.
+    """
+
+    def __init__(self, items=(), threshold=0.5):
+        self.threshold = threshold
+        self._texts = {}
+        self._postings = defaultdict(set)
+        for key, text in items:
+            self.add(key, text)
+
+    def __len__(self):
+        return len(self._texts)
+
+    def __contains__(self, key):
+        return key in self._texts
+
+    def add(self, key, text):
+        """Index text under the given key, replacing any previous text."""
+
+        if key in self._texts:
+            self.remove(key)
+        text = fold(text)
+        self._texts[key] = text
+        for gram in trigrams(text):
+            self._postings[gram].add(key)
+
+    def remove(self, key):
+        """Remove key from index."""
+
+        text = self._texts.pop(key)
+        for gram in trigrams(text):
+            postings = self._postings[gram]
+            postings.discard(key)
+            if not postings:
+                del self._postings[gram]
+
+    def search(self, query, limit=None, fuzzy=True):
+        """Return a list of keys matching query, best matches first.
+
+        Fuzzy matches are only returned if no text contains the query and
+        fuzzy is True."""
+
+        query = fold(query)
+        if not query:
+            return []
+
+        # Substring matches. All inner trigrams of the query words must be
+        # present in the text, which reduces the candidates to verify
+        inner = [word[i:i + 3] for word in query.split()
+                 for i in range(len(word) - 2)]
+        if inner:
+            postings = sorted((self._postings.get(g, set()) for g in inner),
+                              key=len)
+            candidates = postings[0].intersection(*postings[1:])
+        else:
+            candidates = self._texts
+
+        exact = []
+        for key in candidates:
+            text = self._texts[key]
+            if query in text:
+                prefix = text.startswith(query) or (' ' + query) in text
+                exact.append((not prefix, len(text), key))
+        if exact:
+            result = [x[-1] for x in sorted(exact, key=_sort_key)]
+            return result[:limit] if limit else result
+        if not fuzzy:
+            return []
+
+        # Fuzzy matches ranked by the fraction of shared trigrams
+        grams = trigrams(query)
+        counts = defaultdict(int)
+        for gram in grams:
+            for key in self._postings.get(gram, ()):
+                counts[key] += 1
+        fuzzy = []
+        for key, count in counts.items():
+            score = count / len(grams)
+            if score >= self.threshold:
+                fuzzy.append((-score, len(self._texts[key]), key))
+        result = [x[-1] for x in sorted(fuzzy, key=_sort_key)]
+        return result[:limit] if limit else result
+
+
+def _sort_key(item):
+    # Keys may not be mutually comparable, hence we use their repr to break
+    # ties
+    return item[:-1] + (repr(item[-1]),)
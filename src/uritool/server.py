@@ -0,0 +1,216 @@
+"""
+Long running daemon that keeps caches and URI Academic sessions warm.
+
+The daemon listens on a local HTTP port and exposes the main operations as
+JSON endpoints. Each request is a POST to /<operation> with a JSON object of
+parameters. Data frames are returned in pandas' "split" format.
+"""
+import hashlib
+import json
+import os
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib import request as urlrequest
+from urllib.error import HTTPError, URLError
+from . import config
+
+__all__ = ['Server', 'Client', 'serve']
+
+
+class Server(HTTPServer):
+    """HTTP server that holds the warm state of the daemon.
+
+    Requests are processed one at a time, since the url cache is not thread
+    safe. Logged in :class:`uritool.urilib.Discipline` objects are kept in
+    the ``.disciplines`` dictionary, so progress snapshots and parsed tables
+    are reused between requests.
+    """
+
+    def __init__(self, address=None, verbose=False):
+        address = address or ('127.0.0.1', config.serve_port)
+        super().__init__(address, RequestHandler)
+        self.verbose = verbose
+        self.disciplines = {}
+
+    def discipline(self, pk=None, username=None, password=None):
+        """Return a cached Discipline object for the given credentials.
+
+        Cached objects are only returned for the same username and password,
+        which are identified by a hash of both."""
+
+        from .urilib import Discipline
+
+        pk = int(pk or config.uri_discipline)
+        credentials = _credentials(username, password)
+        key = (pk, credentials)
+        try:
+            return self.disciplines[key]
+        except KeyError:
+            # Reuse the login session of disciplines with the same credentials
+            shared = [d for (_, other), d in self.disciplines.items()
+                      if other == credentials]
+            discipline = Discipline(pk, username=username, password=password,
+                                    session_from=(shared or [None])[0])
+            self.disciplines[key] = discipline
+            return discipline
+
+    #
+    # Operations
+    #
+    def op_ping(self):
+        from uritool import __version__
+
+        return {'version': __version__, 'pid': os.getpid()}
+
+    def op_progress(self, homework, discipline=None, username=None,
+                    password=None):
+        discipline = self.discipline(discipline, username, password)
+        return _frame_to_json(discipline.progress(int(homework)))
+
+    def op_grades(self, discipline=None, username=None, password=None,
+                  delay_penalty=None):
+        from .urilib import get_progress
+
+        discipline = self.discipline(discipline, username, password)
+        table = get_progress(discipline, delay_penalty=delay_penalty)
+        return _frame_to_json(table)
+
+    def op_profile(self, id):
+        from .urilib import get_public_profile
+
+        return get_public_profile(int(id), verbose=self.verbose)._asdict()
+
+    def op_compile(self, path):
+        from .__main__ import make_main_csv
+
+        return _frame_to_json(make_main_csv(path))
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    """Dispatch POST /<op> requests to the Server.op_<op> methods."""
+
+    def do_POST(self):
+        op = self.path.strip('/').replace('-', '_')
+        method = getattr(self.server, 'op_' + op, None)
+        if method is None:
+            return self.send_json(404, {'error': 'invalid operation: %s' % op})
+
+        size = int(self.headers.get('Content-Length', 0))
+        try:
+            params = json.loads(self.rfile.read(size).decode('utf8') or '{}')
+            result = method(**params)
+        except Exception as ex:
+            return self.send_json(500, {'error': '%s: %s' % (
+                type(ex).__name__, ex)})
+        self.send_json(200, {'result': result})
+
+    def send_json(self, status, data):
+        body = json.dumps(data, default=str).encode('utf8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, fmt, *args):
+        if self.server.verbose:
+            super().log_message(fmt, *args)
+
+
+class Client:
+    """Thin client for a running uritool daemon.
+
+    Example::
+
+        client = Client()
+        if client.available():
+            table = client.grades(discipline=1234)
+    """
+
+    def __init__(self, host='127.0.0.1', port=None, timeout=600):
+        self.url = 'http://%s:%s/' % (host, port or config.serve_port)
+        self.timeout = timeout
+
+    def available(self):
+        """Return True if the daemon is running.
+
+        Other services listening on the same port are not considered to be
+        a daemon."""
+
+        try:
+            result = self.call('ping', timeout=0.5)
+        except (OSError, URLError, RuntimeError, ValueError):
+            return False
+        return isinstance(result, dict) and 'version' in result
+
+    def call(self, op, timeout=None, **params):
+        """Execute operation in the daemon and return the decoded result."""
+
+        data = json.dumps(params).encode('utf8')
+        req = urlrequest.Request(self.url + op, data=data,
+                                 headers={'Content-Type': 'application/json'})
+        try:
+            response = urlrequest.urlopen(req, timeout=timeout or self.timeout)
+        except HTTPError as ex:
+            response = ex
+        payload = json.loads(response.read().decode('utf8'))
+        if not isinstance(payload, dict):
+            payload = {}
+        if 'error' in payload:
+            raise RuntimeError(payload['error'])
+        if 'result' not in payload:
+            raise RuntimeError('invalid response from %s' % self.url)
+        return payload['result']
+
+    def progress(self, homework, **kwds):
+        return _frame_from_json(self.call('progress', homework=homework,
+                                          **kwds))
+
+    def grades(self, **kwds):
+        return _frame_from_json(self.call('grades', **kwds))
+
+    def profile(self, id):
+        from .urilib import Profile
+
+        return Profile(**self.call('profile', id=id))
+
+    def compile(self, path=None):
+        """Compile the exam files in path (defaults to the current
+        directory of the client, not the one of the daemon)."""
+
+        path = os.path.abspath(path or os.getcwd())
+        return _frame_from_json(self.call('compile', path=path))
+
+
+def serve(host='127.0.0.1', port=None, verbose=False):
+    """Run the daemon until interrupted."""
+
+    server = Server((host, port or config.serve_port), verbose=verbose)
+    print('uritool daemon listening on http://%s:%s/' %
+          server.server_address[:2])
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def _credentials(username, password):
+    data = json.dumps([username, password]).encode('utf8')
+    return hashlib.sha256(data).hexdigest()
+
+
+def _frame_to_json(df):
+    data = json.loads(df.to_json(orient='split', date_format='iso'))
+    data['index_name'] = df.index.name
+    return data
+
+
+def _frame_from_json(data):
+    import pandas as pd
+
+    name = data.pop('index_name', None)
+    df = pd.DataFrame(data['data'], index=data['index'],
+                      columns=data['columns'])
+    df.index.name = name
+    return df
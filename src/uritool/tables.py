@@ -0,0 +1,84 @@
+"""
+Read and write tables in CSV or columnar (Arrow based) formats.
+"""
+import os
+
+__all__ = ['FORMATS', 'save_table', 'read_table', 'table_path']
+
+# Supported formats, in order of preference for reading
+FORMATS = ['parquet', 'feather', 'csv']
+
+
+def table_path(name, format='csv'):
+    """Return the file name for a table with the given base name and
+    format."""
+
+    if format not in FORMATS:
+        raise ValueError('invalid format: %r' % format)
+    return '%s.%s' % (name, format)
+
+
+def save_table(df, name, format='csv'):
+    """Save data frame as name.<format> and return the file name.
+
+    Columnar formats (parquet and feather) preserve dtypes and indexes. They
+    require pyarrow."""
+
+    path = table_path(name, format)
+    if format == 'csv':
+        df.to_csv(path)
+        return path
+
+    pa, feather, parquet = _pyarrow()
+    df = df.copy(deep=False)
+    df.columns = [str(col) for col in df.columns]
+    table = pa.Table.from_pandas(df, preserve_index=True)
+    tmp_path = path + '.tmp'
+    if format == 'parquet':
+        parquet.write_table(table, tmp_path)
+    else:
+        feather.write_feather(table, tmp_path)
+    os.replace(tmp_path, path)
+    return path
+
+
+def read_table(name, formats=FORMATS):
+    """Read table saved with the given base name.
+
+    If the table exists in more than one format, the most recently modified
+    file is used. Ties are resolved in the order given by formats, hence
+    columnar files are preferred over CSV. Columnar files are memory mapped.
+    CSV files are returned as read by pd.read_csv(), i.e., without setting
+    the index. Raises FileNotFoundError if no file exists."""
+
+    import pandas as pd
+
+    candidates = []
+    for priority, format in enumerate(formats):
+        path = table_path(name, format)
+        if os.path.exists(path):
+            mtime = os.stat(path).st_mtime_ns
+            candidates.append((-mtime, priority, format, path))
+    if not candidates:
+        raise FileNotFoundError('no table named %r' % name)
+
+    _, _, format, path = min(candidates)
+    if format == 'csv':
+        return pd.read_csv(path)
+    pa, feather, parquet = _pyarrow()
+    if format == 'parquet':
+        table = parquet.read_table(path, memory_map=True)
+    else:
+        table = feather.read_table(path, memory_map=True)
+    return table.to_pandas()
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.feather
+        import pyarrow.parquet
+    except ImportError:
+        raise SystemExit('pyarrow is required for parquet and feather '
+                         'formats. Install it with "pip install pyarrow".')
+    return pyarrow, pyarrow.feather, pyarrow.parquet
@@ -0,0 +1,35 @@
+import os
+import json
+from uritool import compiler
+from uritool.compiler import collect_exams
+
+
+def test_collect_exams_is_incremental(tmpdir, monkeypatch):
+    tmpdir.join('exam-p1.csv').write('id,name,grade\n1,a,9\n2,b,7\n')
+    tmpdir.join('exam-p2.csv').write('id,name,grade\n2,b,5\n3,c,6\n')
+    df = collect_exams(str(tmpdir))
+    assert list(df.columns) == ['p1', 'p2']
+    assert list(df.index) == [1, 2, 3]
+    assert df.loc[2, 'p2'] == 5
+
+    read = []
+    original = compiler._read_grades
+    monkeypatch.setattr(compiler, '_read_grades',
+                        lambda path: read.append(path) or original(path))
+    tmpdir.join('exam-p2.csv').write('id,name,grade\n2,b,10\n')
+    os.unlink(str(tmpdir.join('exam-p1.csv')))
+    df = collect_exams(str(tmpdir))
+    assert [os.path.basename(x) for x in read] == ['exam-p2.csv']
+    assert list(df.columns) == ['p2']
+    assert df.loc[2, 'p2'] == 10
+
+
+def test_collect_exams_cache_is_json(tmpdir):
+    tmpdir.join('exam-p1.csv').write('id,name,grade\n1,a,9.5\n2,b,\n')
+    collect_exams(str(tmpdir))
+    with open(str(tmpdir.join(compiler.CACHE_NAME))) as F:
+        data = json.load(F)
+    assert data['exam-p1.csv']['ids'] == [1, 2]
+    df = collect_exams(str(tmpdir))
+    assert df.loc[1, 'p1'] == 9.5
+    assert df['p1'].isna().tolist() == [False, True]
@@ -0,0 +1,36 @@
+from decimal import Decimal
+import pandas as pd
+from uritool.datastore import Datastore
+from uritool.grader import Grader
+
+
+def test_datastore_csv_roundtrip(tmpdir):
+    tmpdir.join('students.csv').write('id,name,uri id\n1,a,10\n2,b,20\n')
+    tmpdir.join('exam-p1.csv').write('id,name,grade\n1,a,9\n2,b,7\n')
+    tmpdir.join('exam-p2.csv').write('id,name,grade\n2,b,5\n')
+    with Datastore(str(tmpdir.join('uritool.db'))) as db:
+        assert db.import_csv(str(tmpdir)) == 2
+        main = db.main_table()
+        assert list(main.columns) == ['p1', 'p2']
+        assert main.loc[2, 'p2'] == 5
+        assert pd.isnull(main.loc[1, 'p2'])
+
+        out = tmpdir.mkdir('out')
+        db.export_csv(str(out))
+    exam = pd.read_csv(str(out.join('exam-p1.csv')))
+    assert list(exam['name']) == ['a', 'b']
+    assert list(exam['grade']) == [9, 7]
+
+
+def test_grader_updates_datastore_rows(tmpdir):
+    db = Datastore(str(tmpdir.join('uritool.db')))
+    grader = Grader({1: 'a', 2: 'b'}, validate_id=int, datastore=db,
+                    exam='p1')
+    grader.set_grade(2, Decimal('8.5'))
+    assert db.grades('p1') == {2: 8.5}
+    grader.save()
+    assert db.main_table().loc[2, 'p1'] == 8.5
+
+    progress = pd.DataFrame({101: [100.0, float('nan')]}, index=[10, 20])
+    db.set_progress(1234, progress)
+    assert db.progress(1234).loc[10, 101] == 100
@@ -0,0 +1,59 @@
+import datetime
+import json
+import pytest
+from uritool import urilib
+from uritool.export import open_writer, export_profiles
+from uritool.grades import Change
+
+time = datetime.datetime(2017, 3, 1, 10, 30)
+changes = [Change(1, 10, 1001, float('nan'), 100.0, time)._asdict(),
+           Change(1, 11, 1001, 0.0, 100.0, time)._asdict()]
+
+
+def test_ndjson_writer(tmpdir):
+    path = str(tmpdir.join('out.ndjson'))
+    writer = open_writer(path, 'ndjson')
+    writer.write(changes)
+    writer.close()
+    lines = [json.loads(line) for line in open(path)]
+    assert lines[0]['old'] is None
+    assert lines[1] == dict(homework=1, student=11, problem=1001, old=0.0,
+                            new=100.0, time='2017-03-01T10:30:00')
+
+
+def test_arrow_writer_emits_record_batches(tmpdir):
+    pa = pytest.importorskip('pyarrow')
+    path = str(tmpdir.join('out.arrow'))
+    writer = open_writer(path, 'arrow', 'progress')
+    writer.write(changes[:1])
+    writer.write(changes[1:])
+    writer.close()
+    with pa.ipc.open_stream(path) as reader:
+        batches = list(reader)
+    assert [len(batch) for batch in batches] == [1, 1]
+    table = pa.Table.from_batches(batches)
+    assert table.column('old').to_pylist() == [None, 0.0]
+    assert table.column('time').to_pylist() == [time, time]
+
+
+def test_empty_arrow_stream_has_schema(tmpdir):
+    pa = pytest.importorskip('pyarrow')
+    path = str(tmpdir.join('out.arrow'))
+    open_writer(path, 'arrow', 'progress').close()
+    with pa.ipc.open_stream(path) as reader:
+        assert reader.schema.names[:3] == ['homework', 'student', 'problem']
+        assert list(reader) == []
+
+
+def test_export_profiles_skips_unreadable_profiles(tmpdir, monkeypatch,
+                                                   capsys):
+    profile = urilib.Profile('joe', 'UnB', 'Brasil', 10, 12, 30, 123,
+                             datetime.date(2016, 2, 1))
+    monkeypatch.setattr(urilib, 'iter_cohort', lambda ids, verbose: [
+        (1, profile, []), (2, None, []), (3, profile, [])])
+    path = str(tmpdir.join('out.ndjson'))
+    writer = open_writer(path, 'ndjson')
+    assert export_profiles(writer, [1, 2, 3]) == [2]
+    writer.close()
+    assert [json.loads(line)['id'] for line in open(path)] == [1, 3]
+    assert '2' in capsys.readouterr().err
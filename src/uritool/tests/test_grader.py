@@ -0,0 +1,181 @@
+from decimal import Decimal
+import pandas as pd
+import pytest
+from uritool.grader import Grader, ValidationError
+
+
+@pytest.fixture
+def path(tmpdir):
+    return str(tmpdir.join('exam-p1.csv'))
+
+
+@pytest.fixture
+def grader(path):
+    return Grader({1234: 'John Lennon', 4321: 'Paul McCartney'}, path=path,
+                  validate_id=int)
+
+
+def test_grader_report(grader):
+    grader.set_grade(1234, Decimal('9.5'))
+    df = grader.report()
+    assert list(df.index) == [1234, 4321]
+    assert list(df.columns) == ['name', 'grade', 'timestamp']
+    assert df.loc[1234, 'grade'] == 9.5
+
+
+def test_grader_add_student_keeps_ids_sorted(grader):
+    assert grader.add_student('Ringo Starr (2000)') == 2000
+    assert grader.ids == [1234, 2000, 4321]
+    assert grader.matches('ringo') == [2000]
+
+
+def test_grader_confirms_fuzzy_matches(monkeypatch):
+    grader = Grader({150012345: 'Maria Silva', 170099999: 'Ana Costa'},
+                    validate_id=int)
+    answers = iter(['150012346', '0', 'Pedro Souza (2000)'])
+    monkeypatch.setattr('builtins.input', lambda msg='': next(answers))
+    assert grader.select() == 2000
+
+    # Substring matches are still selected automatically
+    answers = iter(['maria'])
+    assert grader.select() == 150012345
+
+
+def test_grader_converts_ids_read_from_files(grader, path):
+    grader.set_grade(1234, Decimal('9'))
+    grader.save()
+    other = Grader({}, path=path)
+    assert other.add_student('Bia (2000)') == '2000'
+    assert other.ids == ['1234', '2000', '4321']
+    assert other.records['1234'].grade == 9
+
+
+def test_grader_replays_journal(grader, path):
+    grader.set_grade(4321, Decimal('7'))
+    grader.add_student('George Harrison (5000)')
+    grader.set_grade(5000, Decimal('8'))
+    grader.journal.close()
+
+    # Simulate a crash: the CSV file was never rewritten
+    other = Grader({1234: 'John Lennon'}, path=path, validate_id=int)
+    df = other.report()
+    assert list(df.index) == [1234, 4321, 5000]
+    assert list(df['grade'].fillna(0)) == [0, 7, 8]
+    assert df.loc[5000, 'name'] == 'George Harrison'
+
+
+def test_grader_save_compacts_journal(grader, path):
+    grader.set_grade(1234, Decimal('10'))
+    grader.save()
+    assert len(grader.journal) == 0
+    assert Grader(path=path, validate_id=int).records[1234].grade == 10
+
+
+def test_grader_import_records(grader, path):
+    grader.set_grade(4321, Decimal('5'))
+    records = pd.DataFrame({
+        'id': ['1234', 'Ringo Starr (2000)', '4321', '3000', '3000'],
+        'grade': ['9.5', '8', '6', '7', '7.5'],
+    })
+    result = grader.import_records(records)
+    assert (result.imported, result.added) == (2, 1)
+    assert list(result.conflicts['id']) == [4321, 3000, 3000]
+    df = Grader(path=path, validate_id=int).report()
+    assert df.loc[2000, 'name'] == 'Ringo Starr'
+    assert df.loc[4321, 'grade'] == 5
+
+
+def test_grader_reimport_after_reload_has_no_conflicts(grader, path):
+    records = pd.DataFrame({'id': ['1234', '4321'], 'grade': ['7.3', '8']})
+    assert grader.import_records(records).imported == 2
+    other = Grader(path=path, validate_id=int)
+    result = other.import_records(records)
+    assert result.imported == 2
+    assert len(result.conflicts) == 0
+
+
+def test_grader_import_rejects_invalid_rows(grader):
+    records = pd.DataFrame({'id': ['1234', 'foo'], 'grade': ['x', '7']})
+    result = grader.import_records(records)
+    assert result.imported == 0
+    assert len(result.invalid) == 2
+
+
+def test_grader_import_uses_grade_validator(path):
+    def validate_grade(x):
+        grade = Decimal(x)
+        if not 0 <= grade <= 10:
+            raise ValidationError
+        return grade
+
+    grader = Grader({1234: 'John Lennon', 4321: 'Paul McCartney'}, path=path,
+                    validate_id=int, validate_grade=validate_grade)
+    records = pd.DataFrame({'id': ['1234', '4321'], 'grade': ['9.5', '11']})
+    result = grader.import_records(records)
+    assert result.imported == 0
+    assert list(result.invalid['id']) == ['4321']
+
+
+def test_grader_backup_snapshots(grader, path, tmpdir):
+    backup = tmpdir.join('backup')
+    first = grader.save_backup(path)
+    assert grader.save_backup(path) == first
+    grader.compress_backups = True
+    grader.backups = 2
+    for grade in ['1', '2', '3']:
+        grader.set_grade(1234, Decimal(grade))
+        grader.save()
+        grader.save_backup(path)
+    names = sorted(x.basename for x in backup.listdir())
+    assert len(names) == 2
+    assert all(name.endswith('.gz') for name in names)
+
+
+def test_grader_backup_survives_in_place_writes(grader, path):
+    snapshot = grader.save_backup(path)
+    with open(snapshot) as F:
+        contents = F.read()
+    with open(path, 'w') as F:
+        F.write('id,grade\n')
+    with open(snapshot) as F:
+        assert F.read() == contents
+
+
+def test_concurrent_graders(path):
+    students = {1234: 'John Lennon', 4321: 'Paul McCartney'}
+    grader1 = Grader(students, path=path, validate_id=int)
+    grader2 = Grader(students, path=path, validate_id=int)
+    grader1.set_grade(1234, Decimal('9'))
+    grader2.set_grade(4321, Decimal('8'))
+    assert grader2.sync() == []
+    assert grader2.records[1234].grade == 9
+
+    # Newer grades win and are reported as conflicts
+    grader1.set_grade(4321, Decimal('10'))
+    conflicts = grader2.sync()
+    assert [(r['id'], prev) for (r, prev) in conflicts] == [(4321, 8)]
+    assert grader2.records[4321].grade == 10
+
+    # Compaction by one grader is picked up by the other
+    grader2.add_student('Ringo Starr (2000)')
+    grader2.save()
+    grader1.sync()
+    assert 2000 in grader1.records
+    grader1.save()
+    df = Grader(path=path, validate_id=int).report()
+    assert list(df.index) == [1234, 2000, 4321]
+    assert list(df['grade'].fillna(0)) == [9, 0, 10]
+
+
+def test_concurrent_graders_keep_overwrites_after_compaction(path):
+    students = {1234: 'John Lennon', 4321: 'Paul McCartney'}
+    grader1 = Grader(students, path=path, validate_id=int)
+    grader2 = Grader(students, path=path, validate_id=int)
+    grader1.set_grade(1234, Decimal('5'))
+    grader1.save()
+    grader2.save()
+    grader1.set_grade(1234, Decimal('10'))
+    grader1.sync()
+    assert grader1.records[1234].grade == 10
+    grader1.save()
+    assert Grader(path=path, validate_id=int).records[1234].grade == 10
@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+import pytest
+from uritool.grades import ProgressTensor, diff_progress
+
+nan = float('nan')
+
+
+@pytest.fixture
+def tensor():
+    hw1 = pd.DataFrame([[100, 0], [100, 100], [nan, nan]],
+                       index=[1, 2, 3], columns=['1001 (a)', '1002 (b)'])
+    hw2 = pd.DataFrame([[100, 100, 100], [0, nan, 100]],
+                       index=[1, 2], columns=['1003 (c)', '1004 (d)', '1005'])
+    return ProgressTensor.from_frames({10: hw1, 20: hw2})
+
+
+def test_tensor_grades_match_dataframe_mean(tensor):
+    grades = tensor.grades()
+    assert list(grades[10]) == [50, 100, 0]
+    assert grades.loc[2, 20] == pytest.approx(100 / 3)
+    assert np.isnan(grades.loc[3, 20])
+
+
+def test_tensor_policies(tensor):
+    avg = tensor.weighted_average()
+    assert avg[1] == pytest.approx(75)
+    avg = tensor.weighted_average({10: 1, 20: 0})
+    assert avg[2] == pytest.approx(100)
+    avg = tensor.weighted_average(drop_lowest=1)
+    assert list(avg) == [100, 100, 0]
+
+
+def test_tensor_solve_rates(tensor):
+    rates = tensor.solve_rates()
+    assert rates[(10, '1001 (a)')] == pytest.approx(2 / 3)
+    assert rates[(20, '1004 (d)')] == pytest.approx(1 / 2)
+    assert len(rates) == 5
+
+
+def test_tensor_incremental_update(tensor):
+    tensor.grades()
+    hw = pd.DataFrame([[100, 100], [100, 100], [100, nan]],
+                      index=[1, 2, 3], columns=['1001 (a)', '1002 (b)'])
+    changed = tensor.update(10, hw)
+    assert list(changed) == [1, 3]
+    assert list(tensor.grades()[10]) == [100, 100, 50]
+    assert tensor.grades().equals(ProgressTensor(
+        tensor.data, tensor.mask, tensor.students, tensor.homeworks,
+        tensor.problems, tensor.present).grades())
+
+
+def test_diff_progress():
+    old = pd.DataFrame([[0, nan], [nan, nan]], index=[1, 2],
+                       columns=['1001 (a)', '1002 (b)'])
+    new = pd.DataFrame([[100, nan], [nan, 0], [100, nan]], index=[1, 2, 3],
+                       columns=['1001 (a)', '1002 (b)'])
+    changes = diff_progress(old, new, homework=10)
+    assert [(c.student, c.problem, c.new) for c in changes] == [
+        (1, 1001, 100), (2, 1002, 0), (3, 1001, 100)]
+    assert len(diff_progress(None, new)) == 3
@@ -0,0 +1,131 @@
+import datetime
+import pytest
+from uritool import httpcache
+
+
+class FakeResponse:
+    encoding = 'utf-8'
+
+    def __init__(self, url):
+        self.status_code = 404 if url.endswith('missing') else 200
+        self.text = 'data from ' + url
+        if url.endswith('table'):
+            rows = ''.join('<tr><td>%s</td></tr>' % i for i in range(100))
+            self.text = '<table>%s</table><p>ação</p>' % rows
+
+    def iter_content(self, chunk_size):
+        data = self.text.encode('utf8')
+        for i in range(0, len(data), chunk_size):
+            yield data[i:i + chunk_size]
+
+
+class FakeSession:
+    def __init__(self):
+        self.urls = []
+
+    def get(self, url, timeout=None, **kwds):
+        self.urls.append(url)
+        return FakeResponse(url)
+
+
+@pytest.fixture
+def session(tmpdir, monkeypatch):
+    monkeypatch.setattr(httpcache, 'URLCACHE', None)
+    monkeypatch.setattr(httpcache, 'URLCACHEPATH', str(tmpdir.join('cache')))
+    yield FakeSession()
+    httpcache.urlcache().close()
+
+
+def test_urlfetchmany_skips_fresh_urls(session):
+    urls = ['http://a/%s' % i for i in range(10)] + ['http://a/missing']
+    result = httpcache.urlfetchmany(urls, session=session, budget=5,
+                                    verbose=False)
+    assert len(result) == 5
+    result = httpcache.urlfetchmany(urls, session=session, verbose=False)
+    assert len(result) == 6
+    assert result['http://a/missing'] == 404
+    assert len(session.urls) == 11
+    data = httpcache.urlopen('http://a/3', session=session)
+    assert data == 'data from http://a/3'
+    assert len(session.urls) == 11
+
+
+def test_identical_bodies_are_stored_once(session):
+    cache = httpcache.urlcache()
+    httpcache.urlsave('http://a/1', 'same body')
+    httpcache.urlsave('http://a/2', 'same body')
+    bodies = [k for k in cache if k.startswith(httpcache.BODY_PREFIX)]
+    assert len(bodies) == 1
+    digest = httpcache.urldigest('http://a/1')
+    assert digest == httpcache.urldigest('http://a/2')
+    assert httpcache.urlopen('http://a/2', verbose=False) == 'same body'
+
+    httpcache.urlsave('http://a/1', 'new body')
+    httpcache.urldelete('http://a/2')
+    bodies = [k for k in cache if k.startswith(httpcache.BODY_PREFIX)]
+    assert len(bodies) == 1
+    assert httpcache.urlopen('http://a/1', verbose=False) == 'new body'
+
+
+def test_urlgc_migrates_and_removes_orphans(session):
+    cache = httpcache.urlcache()
+    httpcache.urlsave('http://a/1', 'body')
+    cache['http://a/2'] = cache['http://a/1'][0], 'legacy body'
+    cache[httpcache.BODY_PREFIX + 'ff'] = 'orphan'
+    stats = httpcache.urlgc()
+    assert stats == dict(urls=2, bodies=2, removed=1, migrated=1)
+    assert httpcache.urlopen('http://a/2', verbose=False) == 'legacy body'
+    assert isinstance(cache['http://a/2'][1], bytes)
+
+
+def test_urlstream_yields_rows_and_saves_body(session):
+    url = 'http://a/table'
+    rows = httpcache.urlstream(url, tag='tr', session=session, verbose=False,
+                               chunk_size=7)
+    assert [tr.text_content() for tr in rows] == [str(i) for i in range(100)]
+    assert httpcache.urlopen(url, verbose=False).endswith('<p>ação</p>')
+
+    # Second time comes from cache
+    rows = list(httpcache.urlstream(url, tag='tr', verbose=False))
+    assert len(rows) == 100
+    assert session.urls == [url]
+
+    with pytest.raises(RuntimeError):
+        list(httpcache.urlstream('http://a/missing', session=session))
+
+
+def test_cache_bundle_merges_newest_entries(session, tmpdir):
+    path = str(tmpdir.join('bundle.gz'))
+    old = datetime.datetime(2017, 1, 1)
+    new = datetime.datetime(2017, 1, 2)
+    httpcache.urlsave('http://a/1', 'new', new)
+    httpcache.urlsave('http://a/2', 404, new)
+    httpcache.urlsave('http://b/1', 'other', new)
+    assert httpcache.urlexport(path, pattern='http://a/*') == 2
+
+    cache = httpcache.urlcache()
+    cache.clear()
+    httpcache.urlsave('http://a/1', 'old', old)
+    httpcache.urlsave('http://a/2', 'newer', new + datetime.timedelta(1))
+    assert httpcache.urlimport(path) == (1, 1)
+    assert httpcache.urlentry('http://a/1') == (new, 'new')
+    assert httpcache.urlentry('http://a/2')[1] == 'newer'
+    assert 'http://b/1' not in cache
+
+
+def test_urlstream_falls_back_to_stale_cache(session, monkeypatch):
+    url = 'http://a/table'
+    old = datetime.datetime(2000, 1, 1)
+    httpcache.urlsave(url, '<table><tr><td>1</td></tr></table>', old)
+
+    def fail(url, **kwds):
+        raise ConnectionError('offline')
+
+    monkeypatch.setattr(session, 'get', fail)
+    monkeypatch.setattr(httpcache, 'INTERNET_SLOW', False)
+    rows = list(httpcache.urlstream(url, tag='tr', session=session,
+                                    expires=1, verbose=False))
+    assert [tr.text_content() for tr in rows] == ['1']
+    with pytest.raises(ConnectionError):
+        list(httpcache.urlstream('http://a/new', session=session,
+                                 verbose=False))
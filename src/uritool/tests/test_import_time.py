@@ -0,0 +1,33 @@
+import subprocess
+import sys
+
+# Maximum cumulative import time (in microseconds) of the CLI module
+IMPORT_BUDGET = 150000
+HEAVY_MODULES = {'pandas', 'numpy', 'requests', 'lxml'}
+
+
+def import_times(module):
+    """Return a dict mapping imported modules to their cumulative import
+    time as reported by "python -X importtime"."""
+
+    cmd = [sys.executable, '-X', 'importtime', '-c', 'import ' + module]
+    result = subprocess.run(cmd, stderr=subprocess.PIPE,
+                            universal_newlines=True, check=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[12:].split('|')
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def test_cli_does_not_import_heavy_modules():
+    for module in ['uritool.__main__', 'uritool.urilib', 'uritool.httpcache']:
+        imported = set(x.split('.')[0] for x in import_times(module))
+        assert not imported & HEAVY_MODULES, module
+
+
+def test_cli_import_time_budget():
+    times = import_times('uritool.__main__')
+    assert times['uritool.__main__'] < IMPORT_BUDGET
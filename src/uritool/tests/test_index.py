@@ -0,0 +1,52 @@
+import pytest
+from uritool.index import ProblemIndex
+from uritool.urilib import csv_count, get_progress
+
+
+@pytest.fixture
+def index():
+    return ProblemIndex({
+        1: [1001, 1002, 1003],
+        2: [1001],
+        3: [1002],
+        4: [],
+    })
+
+
+def test_index_set_algebra(index):
+    assert list(index.solvers(1001) - index.solvers(1002)) == [2]
+    assert list(index.solvers(1001) & index.solvers(1002)) == [1]
+    assert list(index.solved_any([1001, 1002])) == [1, 2, 3]
+    assert list(index.all() - index.solved_any(index.problems())) == [4]
+    assert list(index.solvers(9999)) == []
+
+
+def test_index_counts(index):
+    assert index.counts() == {1001: 2, 1002: 2, 1003: 1}
+    assert index.count_solved(1) == 3
+    assert index.count_solved(1, [1001, 9999]) == 1
+    assert index.solved(1) == [1001, 1002, 1003]
+
+
+def test_index_incremental_update(index):
+    index.add(2, [1002])
+    index.add(5, [1003])
+    assert list(index.solvers(1002)) == [1, 2, 3]
+    assert list(index.solvers(1003)) == [1, 5]
+    assert index.has_solved(2, 1002)
+    assert not index.has_solved(4, 1002)
+
+
+def test_csv_count_restricts_problems(index):
+    lines = csv_count(index, [1001, 1003]).splitlines()
+    counts = [int(line.split(',')[1]) for line in lines[1:]]
+    assert counts == [2, 1, 0, 0]
+
+
+def test_get_progress_rejects_invalid_penalty():
+    with pytest.raises(ValueError):
+        get_progress(1234, delay_penalty=150)
+
+
+if __name__ == '__main__':
+    pytest.main('test_index.py -q')
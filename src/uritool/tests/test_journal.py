@@ -0,0 +1,23 @@
+from decimal import Decimal
+from datetime import datetime
+from uritool.journal import Journal
+
+
+def test_journal_replay_and_truncate(tmpdir):
+    path = str(tmpdir.join('exam-p1.csv.journal'))
+    journal = Journal(path, sync_every=2)
+    journal.append(1234, Decimal('9.5'), datetime(2017, 1, 1, 10, 0, 0))
+    journal.append('abc', None, name='John Lennon')
+    journal.close()
+    with open(path, 'a') as F:
+        F.write('{"id": 1, "gra')
+
+    records = list(Journal(path).replay())
+    assert len(records) == 2
+    assert records[0]['grade'] == Decimal('9.5')
+    assert records[0]['timestamp'] == datetime(2017, 1, 1, 10, 0, 0)
+    assert records[1]['name'] == 'John Lennon'
+
+    journal.truncate()
+    assert len(journal) == 0
+    assert list(Journal(path).replay()) == []
@@ -0,0 +1,24 @@
+import io
+import pstats
+from uritool import profiling
+from uritool.profiling import span, profile, SPANS
+
+
+def test_span_accumulates_calls():
+    profiling.reset_spans()
+    for _ in range(3):
+        with span('fetch'):
+            pass
+    assert SPANS['fetch'][0] == 3
+    assert 'fetch' in profiling.spans_summary()
+
+
+def test_cpu_profile_writes_pstats_dump(tmpdir):
+    path = str(tmpdir.join('out.prof'))
+    out = io.StringIO()
+    with profile('cpu', path=path, top=5, file=out):
+        with span('parse'):
+            sum(range(1000))
+    assert pstats.Stats(path).total_calls > 0
+    assert 'parse' in out.getvalue()
+    assert path in out.getvalue()
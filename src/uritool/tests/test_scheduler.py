@@ -0,0 +1,78 @@
+import datetime
+import pytest
+from uritool.scheduler import RefreshScheduler
+
+T0 = datetime.datetime(2017, 5, 1, 12, 0)
+minutes = lambda x: datetime.timedelta(minutes=x)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = T0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += datetime.timedelta(seconds=seconds)
+
+
+def make_scheduler():
+    clock = FakeClock()
+    log = []
+    scheduler = RefreshScheduler(lambda hw: log.append((hw, clock.now)),
+                                 clock=clock, sleep=clock.sleep)
+    return scheduler, clock, log
+
+
+def test_scheduler_polls_faster_near_deadline():
+    scheduler, clock, log = make_scheduler()
+    assert scheduler.schedule(1, T0 + minutes(600))
+    assert not scheduler.schedule(2, T0 - minutes(600))
+    scheduler.run()
+
+    times = [t for (_, t) in log]
+    gaps = [(b - a).total_seconds() / 60 for a, b in zip(times, times[1:])]
+    assert gaps[0] == 120
+    assert min(gaps) >= 5
+    assert max(gaps[-4:]) < 10
+    assert times[-2] == T0 + minutes(600)
+    assert times[-1] == T0 + minutes(605)
+    assert len(scheduler) == 0
+
+
+def test_scheduler_coalesces_requests():
+    scheduler, clock, log = make_scheduler()
+    scheduler.schedule(1, T0 + minutes(600))
+    scheduler.schedule(2, T0 + minutes(600), when=T0 + minutes(60))
+    scheduler.request(1)
+    scheduler.request(1)
+    scheduler.request(2)
+    assert len(scheduler) == 2
+    assert scheduler.run_pending() == [1, 2]
+    assert scheduler.next_time() == T0 + minutes(120)
+
+
+def test_scheduler_rejects_unknown_homeworks():
+    scheduler, clock, log = make_scheduler()
+    with pytest.raises(ValueError):
+        scheduler.request(42)
+    assert len(scheduler) == 0
+
+
+def test_scheduler_retries_failed_refreshes():
+    clock = FakeClock()
+    log = []
+
+    def refresh(hw):
+        log.append(clock.now)
+        if len(log) == 1:
+            raise OSError('connection reset')
+
+    scheduler = RefreshScheduler(refresh, clock=clock, sleep=clock.sleep)
+    scheduler.schedule(1, T0 + minutes(600))
+    assert scheduler.run_pending() == []
+    assert scheduler.next_time() == T0 + minutes(5)
+    scheduler.run()
+    assert log[1] == T0 + minutes(5)
+    assert len(scheduler) == 0
@@ -0,0 +1,36 @@
+import pytest
+from uritool.search import SearchIndex, fold
+
+
+@pytest.fixture
+def index():
+    return SearchIndex([
+        (1234, 'João da Silva 1234'),
+        (4321, 'Joana Souza 4321'),
+        (5555, 'Paulo Joanes 5555'),
+    ])
+
+
+def test_fold():
+    assert fold('  JOÃO   Conceição ') == 'joao conceicao'
+
+
+def test_search_substring_and_accents(index):
+    assert index.search('joao') == [1234]
+    assert index.search('JOÃO') == [1234]
+    assert index.search('32') == [4321]
+    assert index.search('joan') == [4321, 5555]
+    assert index.search('xyz') == []
+
+
+def test_search_typos(index):
+    assert index.search('jaona souza')[0] == 4321
+    assert index.search('silvq')[0] == 1234
+    assert index.search('silvq', fuzzy=False) == []
+
+
+def test_search_incremental(index):
+    index.add(7777, 'João Pedro 7777')
+    assert set(index.search('joao')) == {1234, 7777}
+    index.remove(1234)
+    assert index.search('joao') == [7777]
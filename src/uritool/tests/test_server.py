@@ -0,0 +1,80 @@
+import threading
+from http.server import HTTPServer, BaseHTTPRequestHandler
+import pytest
+from uritool.server import Server, Client
+
+
+@pytest.fixture
+def client(tmpdir, monkeypatch):
+    monkeypatch.chdir(str(tmpdir))
+    tmpdir.join('exam-p1.csv').write('id,name,grade\n1,a,9\n2,b,7\n')
+    server = Server(('127.0.0.1', 0))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield Client(port=server.server_address[1])
+    server.shutdown()
+    server.server_close()
+
+
+def test_client_calls_daemon(client):
+    assert client.available()
+    df = client.compile()
+    assert df.index.name == 'id'
+    assert list(df['p1']) == [9, 7]
+
+
+def test_client_reports_errors(client):
+    with pytest.raises(RuntimeError):
+        client.call('invalid')
+    assert not Client(port=1).available()
+
+
+def test_client_ignores_other_services():
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = b'<html>not uritool</html>'
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        assert not Client(port=server.server_address[1]).available()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_client_compiles_given_folder(client, tmpdir):
+    folder = tmpdir.mkdir('course')
+    folder.join('exam-p2.csv').write('id,name,grade\n3,c,5\n')
+    df = client.compile(str(folder))
+    assert list(df.columns) == ['p2']
+    assert list(df['p2']) == [5]
+
+
+def test_discipline_cache_requires_same_password():
+    server = Server(('127.0.0.1', 0))
+    try:
+        first = server.discipline(1, 'user', 'secret')
+        assert server.discipline(1, 'user', 'secret') is first
+        assert server.discipline(1, 'user', 'wrong') is not first
+        assert server.discipline(1, 'user', None) is not first
+    finally:
+        server.server_close()
+
+
+def test_disciplines_share_session_only_with_same_credentials():
+    server = Server(('127.0.0.1', 0))
+    try:
+        first = server.discipline(1, 'user', 'secret')
+        assert server.discipline(2, 'user', 'secret').session_from is first
+        assert server.discipline(3, 'user', 'wrong').session_from is None
+    finally:
+        server.server_close()
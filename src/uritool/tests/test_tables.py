@@ -0,0 +1,43 @@
+import os
+import pandas as pd
+import pytest
+from uritool.tables import save_table, read_table
+
+
+@pytest.mark.parametrize('format', ['parquet', 'feather'])
+def test_columnar_tables_preserve_dtypes(tmpdir, monkeypatch, format):
+    pytest.importorskip('pyarrow')
+    monkeypatch.chdir(str(tmpdir))
+    index = pd.Index([10, 20], name='id')
+    df = pd.DataFrame({'name': ['a', 'b'], 1234: [9.5, 7.0], 'n': [1, 2]},
+                      index=index)
+    tmpdir.join('main.csv').write('id,name\n1,x\n')
+    assert save_table(df, 'main', format) == 'main.' + format
+
+    result = read_table('main')
+    assert result.index.name == 'id'
+    assert list(result.index) == [10, 20]
+    assert list(result.columns) == ['name', '1234', 'n']
+    assert result['n'].dtype == df['n'].dtype
+
+
+def test_read_table_falls_back_to_csv(tmpdir, monkeypatch):
+    monkeypatch.chdir(str(tmpdir))
+    tmpdir.join('main.csv').write('id,name\n1,x\n')
+    assert list(read_table('main')['name']) == ['x']
+    with pytest.raises(FileNotFoundError):
+        read_table('missing')
+
+
+def test_read_table_uses_newest_format(tmpdir, monkeypatch):
+    pytest.importorskip('pyarrow')
+    monkeypatch.chdir(str(tmpdir))
+    from uritool.__main__ import get_main_csv, save_main_csv
+
+    old = pd.DataFrame({'id': [1], 'p1': [5.0]}).set_index('id', drop=False)
+    save_main_csv(old, 'parquet')
+    os.utime('main.parquet', (1, 1))
+    new = pd.DataFrame({'id': [1, 2], 'p1': [7.0, 8.0]})
+    new = new.set_index('id', drop=False)
+    save_main_csv(new, 'csv')
+    assert list(get_main_csv()['p1']) == [7.0, 8.0]
@@ -0,0 +1,114 @@
+import datetime
+import pytest
+from uritool import config, httpcache
+from uritool.__main__ import get_disciplines
+from uritool.urilib import get_disciplines as get_discipline_objects
+from uritool.urilib import PROFILE_URL, get_public_problems, profile_urls
+from uritool.urilib import get_cohort_profiles, iter_cohort
+
+
+def test_disciplines_share_login_session():
+    first, second = get_discipline_objects([1, 2], 'user', 'pass')
+    first.session = session = object()
+    assert second.session is session
+
+
+def test_disciplines_from_config(tmpdir, monkeypatch):
+    monkeypatch.chdir(str(tmpdir))
+    tmpdir.join('uriconfig.ini').write(
+        '[uri]\ndiscipline = 1\n\n[disciplines]\ncalc = 10\nalgo = 20\n')
+    config.reload()
+    try:
+        assert get_disciplines() == {'calc': 10, 'algo': 20}
+        assert get_disciplines(['3,4', '5']) == {'3': 3, '4': 4, '5': 5}
+    finally:
+        monkeypatch.undo()
+        config.reload()
+
+
+@pytest.fixture
+def cache(tmpdir, monkeypatch):
+    monkeypatch.setattr(httpcache, 'URLCACHE', None)
+    monkeypatch.setattr(httpcache, 'URLCACHEPATH', str(tmpdir.join('cache')))
+    yield httpcache.urlcache()
+    httpcache.urlcache().close()
+
+
+INFO = ('<div class="pb-username">joe</div><ul class="pb-information">'
+        '<li>Universidade: UnB </li><li>País: Brasil</li>'
+        '<li>Posição: 123º</li><li>Resolvido: 10</li><li>Tentado: 12</li>'
+        '<li>Submissões: 30</li><li>Desde: 01/02/2016</li></ul>')
+
+
+def profile_page(rows, pages):
+    links = ''.join('<a href="/judge/pt/profile/1/page:%s">%s</a>' % (i, i)
+                    for i in range(1, pages + 1))
+    links += '<a href="/judge/pt/problems/all/page:40">problems</a>'
+    links += '<a href="/judge/pt/profile/11/page:50">other</a>'
+    row = ('<tr><td>%s</td><td>name</td><td>1%%</td><td>42</td>'
+           '<td>Python 3</td><td>0.1</td><td>01/02/2017 - 10:20:30</td></tr>')
+    body = ''.join(row % (1000 + i) for i in range(rows))
+    return ('<html><body>%s<table><tbody>%s</tbody></table>%s</body></html>'
+            % (INFO, body, links))
+
+
+def test_public_problems_reads_page_count(cache):
+    httpcache.urlsave(PROFILE_URL % (1, 1), profile_page(28, 2))
+    httpcache.urlsave(PROFILE_URL % (1, 2), profile_page(3, 2))
+    assert len(profile_urls(1)) == 2
+    problems = get_public_problems(1, verbose=False)
+    assert len(problems) == 31
+    assert problems['id'][0] == 1000
+
+
+def test_negative_responses_expire(cache):
+    url = PROFILE_URL % (1, 3)
+    httpcache.urlsave(url, 404)
+    with pytest.raises(RuntimeError):
+        httpcache.urlopen(url, verbose=False)
+    assert httpcache.urlfresh(url)
+    cache[url] = datetime.datetime(2000, 1, 1), 404
+    assert not httpcache.urlfresh(url)
+
+
+def test_uri_academic_table_merges_by_uri_id():
+    import pandas as pd
+    from uritool.__main__ import uri_academic_table
+
+    students = pd.DataFrame({'name': ['a', 'b', 'c'],
+                             'uri id': [10.0, float('nan'), 30.0]},
+                            index=pd.Index([3, 1, 2], name='id'))
+    grades = pd.DataFrame({101: [50.0, 100.0]},
+                          index=pd.Index([30, 10], name='uri_id'))
+    table = uri_academic_table(grades, students)
+    assert list(table.index) == [1, 2, 3]
+    assert list(table.columns) == ['name', 'uri id', 101]
+    assert table[101].dtype == float
+    assert list(table[101].fillna(-1)) == [-1, 50.0, 100.0]
+
+    grades.loc[99] = 0.0
+    table = uri_academic_table(grades, students)
+    assert list(table['uri id'].fillna(-1)) == [-1, 30, 10]
+    assert list(table[101].fillna(-1)) == [-1, 50.0, 100.0]
+
+
+def test_cohort_profiles_parse_first_page_once(cache):
+    httpcache.urlsave(PROFILE_URL % (1, 1), profile_page(5, 1))
+    httpcache.urlsave(PROFILE_URL % (2, 1), 404)
+    (_, profile, problems), (_, missing, _) = iter_cohort([1, 2])
+    assert profile.username == 'joe'
+    assert len(problems) == 5
+    assert missing is None
+
+    df = get_cohort_profiles([1, 2])
+    assert df.loc[1, 'ranking'] == 123
+    assert df.loc[1, 'university'] == 'UnB'
+    assert str(df['solved'].dtype) == 'Int64'
+    assert df['date'].dtype.kind == 'M'
+    assert df['solved'].isna().tolist() == [False, True]
+
+
+def test_missing_profile_is_empty(cache):
+    httpcache.urlsave(PROFILE_URL % (1, 1), 404)
+    assert profile_urls(1) == []
+    assert len(get_public_problems(1, verbose=False)) == 0
@@ -4,13 +4,12 @@ Tools for fetching data from the URI online judge website
 """
 import re
 import datetime
-import requests
-import pandas as pd
-import numpy as np
-from collections import namedtuple, OrderedDict
-from lxml import html as etree
-from uritool.httpcache import htmlopen, urlcache, urlopen, urldate
+from collections import namedtuple
+from uritool.httpcache import htmlopen, urldate, urlfresh
+from uritool.httpcache import urldigest, urlfetchmany, urlstream
 from uritool.util import normalize_language
+from uritool.index import ProblemIndex
+from uritool.profiling import span
 from uritool import config
 
 # Constants
@@ -19,90 +18,171 @@ profile_fields = ('username university country solved tried submissions '
                   'ranking date').split()
 Problem = namedtuple('Problem', problem_fields)
 Profile = namedtuple('Profile', profile_fields)
+PROFILE_PAGE_SIZE = 28
 
 __version__ = '0.2'
 
+# Urls
+BASE_URL = 'https://www.urionlinejudge.com.br'
+PROFILE_URL = (BASE_URL + '/judge/pt/profile/%s/page:%s'
+               '/sort:run_id/direction:asc')
+LOGIN_URL = BASE_URL + '/academic/login'
+DISCIPLINE_URL = BASE_URL + '/academic/disciplines/view/%s'
+PROGRESS_URL = BASE_URL + '/academic/homeworks/progress/%s'
+HOMEWORK_URL = BASE_URL + '/academic/homeworks/view/%s'
+
 
 #
 # Extract problems and information from the website
 #
 def get_public_problems(profile, verbose=True):
-    """Extract public submissions from the given profile."""
+    """Extract public submissions from the given profile.
 
-    problems = []
-    urlbase = ('https://www.urionlinejudge.com.br/judge/pt/profile/'
-               '%s/page:%s/sort:run_id/direction:asc')
-    refreshed = set()
-    i = 0
+    The number of pages is read from the pagination links of the first page
+    and all missing pages are downloaded concurrently."""
+
+    import pandas as pd
 
+    try:
+        transaction, pages = _profile_page(profile, 1, verbose=verbose)
+    except RuntimeError as ex:
+        if ex.args[0] == 404:
+            return pd.DataFrame([], columns=problem_fields)
+        raise
+    urls = [PROFILE_URL % (profile, i) for i in range(2, pages + 1)]
+    urlfetchmany(urls, verbose=verbose)
+
+    problems = []
+    page = 1
     while True:
-        i += 1
-        url = urlbase % (profile, i)
+        # The last page may have grown since it was cached
+        if page >= pages and len(transaction) < PROFILE_PAGE_SIZE:
+            transaction, _ = _profile_page(profile, page, verbose=verbose,
+                                           expires=120)
+
+        # Add transaction to problem list. A full last page might be
+        # followed by a new page
+        problems.extend(transaction)
+        if page >= pages and len(transaction) < PROFILE_PAGE_SIZE:
+            break
+        page += 1
 
-        # Read html or break if encounter an error page
+        # Read page or break if encounter an error page
         try:
-            html = htmlopen(url, verbose=verbose)
+            transaction, _ = _profile_page(profile, page, verbose=verbose)
         except RuntimeError as ex:
             if ex.args[0] == 404:
                 break
             raise
 
-        # Process table
-        tbody = html.xpath('//table/tbody')[0]
-        transaction = []
-        for tr in tbody:
-            data = [x.text_content().strip() for x in tr]
-            if not data[0] or len(data) == 1:
-                break
+    # Create dataframe
+    return pd.DataFrame(problems, columns=problem_fields)
 
-            # Convert some columns..
-            data[0] = int(data[0])  # problem profile
-            data[2] = _ranking(data[2])  # ranking
-            data[5] = float(data[5])  # time
-            data[6] = _todatetime(data[6])  # date
 
-            problem = Problem(*data)
-            transaction.append(problem)
+def profile_urls(profile, verbose=True):
+    """Return the urls of all pages of submissions in the given profile.
 
-        # Add transaction to problem list
-        if len(transaction) == 28:
-            problems.extend(transaction)
-        elif url not in refreshed:
-            # Force refresh
-            urlopen(url, verbose=verbose, expires=120)
-            refreshed.add(url)
-            i -= 1
-        else:
-            problems.extend(transaction)
-            break
+    The page count is read from the pagination links of the first page.
+    Return an empty list if the profile does not exist."""
 
-    # Create dataframe
-    return pd.DataFrame(problems, columns=problem_fields)
+    try:
+        _, pages = _profile_page(profile, 1, verbose=verbose)
+    except RuntimeError as ex:
+        if ex.args[0] == 404:
+            return []
+        raise
+    return [PROFILE_URL % (profile, i) for i in range(1, pages + 1)]
 
 
 def get_public_profile(profile, verbose=True):
     """View all non-problem related information in the public profile."""
 
-    url = ('https://www.urionlinejudge.com.br/judge/pt/profile/'
-           '%s/page:1/sort:run_id/direction:asc') % profile
-    html = htmlopen(url, verbose=verbose)
-    username = html.xpath('//div[@class="pb-username"]')[0].text_content()
-    info = html.xpath('//ul[@class="pb-information"]/li')
-    data = (x.text_content().strip() for x in info)
-    data = (x.partition(':') for x in data)
-    data = dict((k.lower(), v) for (k, _, v) in data)
-    data['username'] = username
+    url = PROFILE_URL % (profile, 1)
+    return _profile_info(htmlopen(url, verbose=verbose))
 
-    # Make conversions
-    dd, mm, yyyy = map(int, data.pop('desde').split('/'))
-    data['date'] = datetime.date(yyyy, mm, dd)
-    data['ranking'] = int(data.pop('posição')[:-1])
-    data['solved'] = int(data.pop('resolvido'))
-    data['submissions'] = int(data.pop('submissões'))
-    data['tried'] = int(data.pop('tentado'))
-    data['country'] = data.pop('país')
-    data['university'] = data.pop('universidade').strip()
-    return Profile(**data)
+
+def iter_cohort(ids, workers=8, verbose=False):
+    """Iterate over tuples (id, profile, problems) with the Profile and the
+    list of problems in the first page of each of the given URI profiles.
+
+    First pages are downloaded in parallel and each page is parsed only
+    once. Profiles that could not be read are returned as (id, None, [])."""
+
+    urls = [PROFILE_URL % (id_, 1) for id_ in ids]
+    urlfetchmany(urls, workers=workers, verbose=verbose)
+    for id_, url in zip(ids, urls):
+        try:
+            html = htmlopen(url, verbose=verbose)
+            profile = _profile_info(html)
+        except (RuntimeError, IndexError, KeyError, ValueError):
+            yield id_, None, []
+            continue
+        problems = []
+        tbodies = html.xpath('//table/tbody')
+        with span('extract'):
+            for tr in tbodies[0] if tbodies else ():
+                problem = _profile_row(tr)
+                if problem is None:
+                    break
+                problems.append(problem)
+        yield id_, profile, problems
+
+
+def get_cohort_profiles(ids=None, workers=8, verbose=False):
+    """Return a data frame with the public profiles of a cohort of students.
+
+    Parameters
+    ----------
+
+    ids : sequence
+        URI ids. Defaults to all ids in students.csv.
+    workers : int
+        Number of concurrent downloads.
+
+    Returns
+    -------
+
+    A data frame indexed by URI id with username, university, country,
+    ranking, solved, tried, submissions and date columns. Profiles that
+    could not be read have empty values.
+    """
+
+    import pandas as pd
+
+    if ids is None:
+        from uritool.tables import read_table
+
+        ids = pd.to_numeric(read_table('students')['uri id'],
+                            errors='coerce').dropna()
+    ids = [int(x) for x in ids]
+
+    rows = []
+    for id_, profile, _ in iter_cohort(ids, workers=workers,
+                                       verbose=verbose):
+        rows.append(profile or Profile(*[None] * len(profile_fields)))
+    df = pd.DataFrame(rows, columns=profile_fields,
+                      index=pd.Index(ids, name='uri id', dtype='int64'))
+    for col in ['username', 'university', 'country']:
+        df[col] = df[col].astype('string')
+    for col in ['solved', 'tried', 'submissions', 'ranking']:
+        df[col] = df[col].astype('Int64')
+    df['date'] = pd.to_datetime(df['date'])
+    return df
+
+
+def get_disciplines(pks, username=None, password=None, verbose=False):
+    """Return a list of Discipline objects for the given discipline ids.
+
+    All disciplines share the login session of the first one, hence the
+    login happens at most once."""
+
+    disciplines = []
+    for pk in pks:
+        session_from = disciplines[0] if disciplines else None
+        disciplines.append(Discipline(pk, username=username,
+                                      password=password, verbose=verbose,
+                                      session_from=session_from))
+    return disciplines
 
 
 def get_detailed_progress(discipline, homework, username=None, password=None):
@@ -120,14 +200,15 @@ def get_progress(discipline=None, username=None, password=None,
     Parameters
     ----------
 
-    discipline: int
+    discipline: int or Discipline
         URI id for the desired discipline
     username, password: str
         Site credentials. It will use the authentication provided in the
         `uriconfig.ini` file, if not provided.
     delay_penalty : float
-        Represents the fraction of the total grade that is discarded due to
-        delayed submissions.
+        Percentage (in the 0-100 range) of the grade that is discarded for
+        problems solved after the deadline. Raises ValueError for values
+        outside this range.
 
     Returns
     -------
@@ -146,27 +227,37 @@ def get_progress(discipline=None, username=None, password=None,
     column correspond to a homework.
     """
 
-    discipline = Discipline(discipline, username=username, password=password)
+    import pandas as pd
+
+    if delay_penalty is not None:
+        delay_penalty = float(delay_penalty)
+        if not 0 <= delay_penalty <= 100:
+            raise ValueError('delay penalty must be in the 0-100 range, got '
+                             '%s' % delay_penalty)
+
+    if not isinstance(discipline, Discipline):
+        discipline = Discipline(discipline, username=username,
+                                password=password)
 
     if delay_penalty is None:
         return discipline.full_grades()
-    delay_penalty = 1.0
+    delayed_ratio = 1.0 - delay_penalty / 100
 
     # Fetch all student responses
-    student_problems = {id_: get_public_problems(id_)
+    student_problems = {id_: get_public_problems(id_)['id']
                         for id_ in discipline.students.index}
+    index = ProblemIndex(student_problems)
 
-    # Fetch graded homeworks and try to merge both
-    homework_ids = discipline.homeworks.id
-    data = [discipline.progress(id).fillna(0) for id in homework_ids]
+    # Fetch graded homeworks and give partial credit to problems that were
+    # solved only after the deadline
     df = pd.DataFrame()
-    for hw_id, homework in zip(homework_ids, data):
-        problems = [int(col.partition(' ')[0]) for col in homework.columns]
-        for idx, row in homework.iterrows():
-            solved = set(p for p in problems if p in student_problems[idx])
-            for p, result in row.items():
-                if not result and p in solved:
-                    row[p] = delayed_ratio * 100
+    for hw_id in discipline.homeworks.index:
+        homework = discipline.progress(hw_id).fillna(0)
+        for col in homework.columns:
+            problem = int(col.partition(' ')[0])
+            late = homework.index.isin(list(index.solvers(problem)))
+            late &= (homework[col] == 0).values
+            homework.loc[late, col] = delayed_ratio * 100
         df[hw_id] = homework.mean(1)
     return df
 
@@ -197,15 +288,24 @@ def filter_problems(problems, lang=None, ids=(), maxdate=None, mindate=None):
 # URI Academic
 #
 class Discipline:
-    """Expose information from a single discipline in URI Academic."""
+    """Expose information from a single discipline in URI Academic.
+
+    Disciplines created with ``session_from=other`` reuse the login session
+    (and its connection pool) of the other discipline instead of logging in
+    again."""
 
-    def __init__(self, pk=None, username=None, password=None, verbose=False):
+    def __init__(self, pk=None, username=None, password=None, verbose=False,
+                 session_from=None):
         self.pk = pk or config.uri_discipline
         self.username = username
         self.password = password
         self.verbose = verbose
         self.username = username or config.uri_username
         self.password = password or config.uri_password
+        self.session_from = session_from
+        self.snapshots = {}
+        self._extracted = {}
+        self._tensor = None
 
     def __getattr__(self, attr):
         if attr in ['homeworks', 'students', 'title', 'professor']:
@@ -225,6 +325,9 @@ class Discipline:
         try:
             return self._session
         except AttributeError:
+            if self.session_from is not None:
+                self._session = self.session_from.session
+                return self._session
             if self.username is None or self.password is None:
                 msg = 'cannot start session without username and password'
                 raise RuntimeError(msg)
@@ -241,9 +344,15 @@ class Discipline:
     def login(self):
         """Login in Academic using the given credentials."""
 
-        # Retrieve and parse data
-        loginurl = 'https://www.urionlinejudge.com.br/academic/login'
+        import requests
+        from lxml import html as etree
+
+        # Retrieve and parse data. The connection pool is large enough for
+        # the concurrent fetcher (see httpcache.urlfetchmany)
+        loginurl = LOGIN_URL
         self.session = requests.session()
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=16)
+        self.session.mount('https://', adapter)
         request = self.session.get(loginurl)
         data = request.text
         parser = etree.HTMLParser()
@@ -266,81 +375,185 @@ class Discipline:
         }
         self.session.post(loginurl, data=payload)
 
-    def progress(self, homework):
+    def progress(self, homework, expires=None):
         """Return a table with the progress of each student in the chosen
-        homework."""
+        homework.
+
+        Cached pages older than `expires` minutes are downloaded again. If
+        not given, pages are refreshed every 2 hours until the deadline."""
+
+        import numpy as np
+        import pandas as pd
 
-        url = 'https://www.urionlinejudge.com.br/academic/homeworks/progress/%s'
-        urldetail = 'https://www.urionlinejudge.com.br/academic/homeworks' \
-                    '/view/%s'
-        data = self.__htmlopen(url % homework)
-        details = self.__htmlopen(urldetail % homework)
+        url = PROGRESS_URL
+        urldetail = HOMEWORK_URL
+        data = self.__htmlopen(url % homework, expires=expires)
+        details = self.__htmlopen(urldetail % homework, expires=expires)
 
         # If deadline is not expired, reload a more recent version every 2 hours
         was_loaded = urldate(url % homework)
         deadline = data.xpath('//li[@class="box st-r"]/strong')[0]
         dd, mm = map(int, deadline.text_content().split('/'))
         deadline = datetime.datetime(was_loaded.year, mm, dd, 23, 59, 59)
-        if was_loaded <= deadline:
-            data = self.__htmlopen(url % homework, expire=120)
-            details = self.__htmlopen(urldetail % homework, expire=120)
-
-        # Extract question names
-        question_to_name = {}
-        rows = details.get_element_by_id('hw-list').xpath('tbody/tr')
-        for row in rows:
-            question_id = int(row[1].text_content())
-            question_name = row[2].text_content().strip()
-            question_to_name[question_id] = question_name
-
-        # Get responses
-        table = data.xpath('//div[@class="homeworks progess"]/table')[0]
-        responses = []
-        index = []
-        for row in table[1:]:
-            student_url = row[0].xpath('a')[0].attrib['href']
-            student_id = int(student_url.rpartition('/')[-1])
-            index.append(student_id)
-            response = []
-
-            for x in row[1:-1]:
-                if x[0].attrib['class'] == 'void':
-                    value = float('nan')
-                elif x[0].attrib['class'] == 'tried':
-                    value = 0
-                elif x[0].attrib['class'] == 'solved':
-                    value = 100
-                else:
-                    raise RuntimeError
-                response.append(value)
-            responses.append(response)
-
-        # Valid header
-        header = table[0]
-        valid_cols = len(header) - sum(x.text_content() == '-' for x in header)
-        valid_cols -= 2  # name/total
-        header = [int(x.text_content()) for x in header[1:valid_cols + 1]]
-        header = ['%s (%s)' % (id, question_to_name[id]) for id in header]
-        responses = [row[:valid_cols] for row in responses]
-
-        # Extact columns and make dataframe
-        index = pd.Index(index, name='uri_id')
-        return pd.DataFrame(np.array(responses), index=index, columns=header)
+        if expires is None and was_loaded <= deadline:
+            data = self.__htmlopen(url % homework, expires=120)
+            details = self.__htmlopen(urldetail % homework, expires=120)
+
+        # Reuse the last table if pages did not change
+        digests = (urldigest(url % homework), urldigest(urldetail % homework))
+        last_digests, last_table = self._extracted.get(homework, (None, None))
+        if None not in digests and digests == last_digests:
+            return last_table
+
+        with span('extract'):
+            # Extract question names
+            question_to_name = {}
+            rows = details.get_element_by_id('hw-list').xpath('tbody/tr')
+            for row in rows:
+                question_id = int(row[1].text_content())
+                question_name = row[2].text_content().strip()
+                question_to_name[question_id] = question_name
+
+            # Get responses
+            table = data.xpath('//div[@class="homeworks progess"]/table')[0]
+            responses = []
+            index = []
+            for row in table[1:]:
+                student_url = row[0].xpath('a')[0].attrib['href']
+                student_id = int(student_url.rpartition('/')[-1])
+                index.append(student_id)
+                response = []
+
+                for x in row[1:-1]:
+                    if x[0].attrib['class'] == 'void':
+                        value = float('nan')
+                    elif x[0].attrib['class'] == 'tried':
+                        value = 0
+                    elif x[0].attrib['class'] == 'solved':
+                        value = 100
+                    else:
+                        raise RuntimeError
+                    response.append(value)
+                responses.append(response)
+
+            # Valid header
+            header = table[0]
+            valid_cols = len(header) - sum(x.text_content() == '-'
+                                           for x in header)
+            valid_cols -= 2  # name/total
+            header = [int(x.text_content()) for x in header[1:valid_cols + 1]]
+            header = ['%s (%s)' % (id, question_to_name[id]) for id in header]
+            responses = [row[:valid_cols] for row in responses]
+
+            # Extact columns and make dataframe
+            index = pd.Index(index, name='uri_id')
+            table = pd.DataFrame(np.array(responses), index=index,
+                                 columns=header)
+        self._extracted[homework] = digests, table
+        return table
 
     def full_grades(self):
         """Return a table with the progress of each student in all homeworks
-        in the given discipline."""
+        in the given discipline.
+
+        Successive calls only recompute the grades of students whose progress
+        changed since the last call."""
+
+        import pandas as pd
 
+        self.poll()
         df = pd.DataFrame(self.students['name'])
-        for hw in self.homeworks.index:
-            df[hw] = self.progress(hw).fillna(0).mean(1)
-        return df
+        return df.join(self.progress_tensor().grades())
+
+    def progress_tensor(self):
+        """Return a :class:`ProgressTensor` with the progress of each student
+        in all homeworks of the discipline."""
+
+        from uritool.grades import ProgressTensor
+
+        if self._tensor is None:
+            for hw in self.homeworks.index:
+                if hw not in self.snapshots:
+                    self.snapshots[hw] = self.progress(hw)
+            frames = {hw: self.snapshots[hw] for hw in self.homeworks.index}
+            self._tensor = ProgressTensor.from_frames(
+                frames, students=self.students.index)
+        return self._tensor
+
+    def poll(self, homeworks=None, expires=None):
+        """Fetch the progress of the given homeworks (defaults to all) and
+        return a list of Change tuples with the differences from the previous
+        snapshot. The `expires` argument is passed to :meth:`progress`.
+
+        Snapshots are kept in the ``.snapshots`` dictionary and the progress
+        tensor is updated incrementally."""
+
+        from uritool.grades import diff_progress
+
+        url = PROGRESS_URL
+        if homeworks is None:
+            homeworks = list(self.homeworks.index)
+
+        changes = []
+        for hw in homeworks:
+            new = self.progress(hw, expires=expires)
+            old = self.snapshots.get(hw)
+            if new is old:
+                continue
+            self.snapshots[hw] = new
+            if old is not None:
+                changes.extend(diff_progress(old, new, hw, urldate(url % hw)))
+            if self._tensor is not None:
+                try:
+                    self._tensor.update(hw, new)
+                except ValueError:
+                    self._tensor = None
+        return changes
+
+    def urls(self, profiles=True, closed=True):
+        """Return a list with the urls of all pages needed to grade the
+        discipline: homework progress and details and the first page of the
+        public profile of each student.
+
+        Profiles and homeworks whose deadline has passed can be excluded
+        passing profiles=False and closed=False."""
+
+        urls = []
+        now = datetime.datetime.now()
+        for hw, deadline in self.homeworks['deadline'].items():
+            if not closed and deadline < now:
+                continue
+            urls.append(PROGRESS_URL % hw)
+            urls.append(HOMEWORK_URL % hw)
+        if profiles:
+            urls.extend(PROFILE_URL % (id_, 1) for id_ in self.students.index)
+        return urls
+
+    def scheduler(self, callback=None, **kwds):
+        """Return a :class:`uritool.scheduler.RefreshScheduler` that polls
+        all homeworks of the discipline according to their deadlines.
+
+        The callback receives the homework id and the list of changes
+        returned by :meth:`poll` after each refresh. Additional keyword
+        arguments are passed to the scheduler constructor."""
+
+        from uritool.scheduler import RefreshScheduler
+
+        def refresh(homework):
+            changes = self.poll([homework], expires=0)
+            if callback is not None:
+                callback(homework, changes)
+
+        scheduler = RefreshScheduler(refresh, **kwds)
+        for hw, deadline in self.homeworks['deadline'].items():
+            scheduler.schedule(hw, deadline)
+        return scheduler
 
     #
     # Private utility methods
     #
     def __htmlopen(self, url, **kwds):
-        if url in urlcache():
+        if not kwds.get('refresh') and urlfresh(url, kwds.get('expires')):
             return htmlopen(url, **kwds)
         else:
             return htmlopen(url, session=self.session, **kwds)
@@ -348,11 +561,13 @@ class Discipline:
     def __fetch_details(self):
         """Fetch details from the first page."""
 
+        import pandas as pd
+
         def getdate(x):
             x = x.rpartition(' ')[0]
             return datetime.datetime.strptime(x, '%B %d, %Y %H:%M %p')
 
-        url = 'https://www.urionlinejudge.com.br/academic/disciplines/view/%s'
+        url = DISCIPLINE_URL
         html = self.__htmlopen(url % self.pk, refresh=False)
 
         # Main details
@@ -390,14 +605,14 @@ def csv_check(D, problems=None):
     """From a mapping from students to problems, print a table with students
     as rows of zeros and ones telling which problems were solved"""
 
-    problems = sorted(problems or _problemset(D))
-    solvedmap = _solvedproblems(D)
+    index = D if isinstance(D, ProblemIndex) else ProblemIndex(D)
+    problems = sorted(problems or index.problems())
 
     data = ['id, '.rjust(27) + ', '.join(map(str, problems))]
-    for st, solved in sorted(solvedmap.items()):
+    for st in index.students():
         line = [str(st).rjust(25)]
         for p in problems:
-            if p in solved:
+            if index.has_solved(st, p):
                 line.append('   1')
             else:
                 line.append('   0')
@@ -406,16 +621,17 @@ def csv_check(D, problems=None):
     return unindent('\n'.join(data))
 
 
-def csv_count(D, problems):
+def csv_count(D, problems=None):
     """From a mapping from students to problems, print a table with students
-    as rows with the counts of solved problems"""
+    as rows with the counts of solved problems. If problems is given, only
+    count problems in that list."""
 
-    problems = sorted(problems or _problemset(D))
-    solvedmap = _solvedproblems(D)
+    index = D if isinstance(D, ProblemIndex) else ProblemIndex(D)
 
     data = ['id, count'.rjust(32)]
-    for st, solved in sorted(solvedmap.items()):
-        line = [str(st).rjust(25), str(len(set(solved))).rjust(5)]
+    for st in index.students():
+        count = index.count_solved(st, problems)
+        line = [str(st).rjust(25), str(count).rjust(5)]
         data.append(', '.join(line))
 
     return unindent('\n'.join(data))
@@ -433,19 +649,84 @@ def unindent(st):
     return '\n'.join([line[indent:] for line in lines])
 
 
-def _solvedproblems(D):
-    solved = {}
-    for student, L in D.items():
-        solved[student] = set(p.id for p in L)
-    return solved
+def _profile_page(profile, page, verbose=True, expires=None):
+    """Return a tuple (problems, pages) with the list of problems in a page of
+    the public profile and the number of pages listed in the pagination
+    links. Raises RuntimeError for error pages.
+
+    The page is parsed while it is downloaded and table rows are discarded
+    as soon as they are converted."""
+
+    url = PROFILE_URL % (profile, page)
+    transaction = []
+    tbody = None
+    pages = [1]
+    done = False
+
+    # Only links to other pages of the same profile count as pagination
+    page_link = re.compile(r'/profile/%s/page:(\d+)' % profile)
+    for elem in urlstream(url, tag=('tr', 'a'), verbose=verbose,
+                          expires=expires):
+        if elem.tag == 'a':
+            match = page_link.search(elem.get('href', ''))
+            if match:
+                pages.append(int(match.group(1)))
+            continue
+
+        # Only rows of the first table body contain problems
+        parent = elem.getparent()
+        if done or parent is None or parent.tag != 'tbody':
+            continue
+        tbody = parent if tbody is None else tbody
+        if parent is not tbody:
+            done = True
+            continue
+        with span('extract'):
+            problem = _profile_row(elem)
+        if problem is None:
+            done = True
+        else:
+            transaction.append(problem)
+        elem.clear()
+    return transaction, max(pages)
 
 
-def _problemset(D):
-    problems = set()
-    for L in D.values():
-        for p in L:
-            problems.add(p.id)
-    return problems
+def _profile_info(html):
+    """Return a Profile with the information of a parsed profile page."""
+
+    username = html.xpath('//div[@class="pb-username"]')[0].text_content()
+    info = html.xpath('//ul[@class="pb-information"]/li')
+    data = (x.text_content().strip() for x in info)
+    data = (x.partition(':') for x in data)
+    data = dict((k.lower(), v) for (k, _, v) in data)
+    data['username'] = username
+
+    # Make conversions
+    dd, mm, yyyy = map(int, data.pop('desde').split('/'))
+    data['date'] = datetime.date(yyyy, mm, dd)
+    data['ranking'] = int(data.pop('posição')[:-1])
+    data['solved'] = int(data.pop('resolvido'))
+    data['submissions'] = int(data.pop('submissões'))
+    data['tried'] = int(data.pop('tentado'))
+    data['country'] = data.pop('país')
+    data['university'] = data.pop('universidade').strip()
+    return Profile(**data)
+
+
+def _profile_row(tr):
+    """Return a Problem from a row of the profile table or None for the
+    empty row that ends the table."""
+
+    data = [x.text_content().strip() for x in tr]
+    if not data[0] or len(data) == 1:
+        return None
+
+    # Convert some columns..
+    data[0] = int(data[0])  # problem profile
+    data[2] = _ranking(data[2])  # ranking
+    data[5] = float(data[5])  # time
+    data[6] = _todatetime(data[6])  # date
+    return Problem(*data)
 
 
 def _todatetime(st):